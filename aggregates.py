@@ -0,0 +1,283 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from dataset import LEVELS
+
+# breakdowns kept in the student cube: (column, split by decision) -> how
+# many LEVELS deep it is computed. distinct students do not add up across
+# levels (a student sits in several years and semesters), so every depth is
+# counted on its own rather than rolled up
+CUBE = {
+    (None, False): (1, 2, 3, 4, 5),
+    ('decision', False): (1, 2, 3, 4, 5),
+    ('gender', True): (1, 2, 3, 4, 5),
+    ('grade', True): (1, 2, 3, 4, 5),
+    ('attendancetype', False): (2,),
+    ('academicyear', False): (2,),
+    ('programmecode', True): (1,),
+    ('module', True): (5,),
+}
+
+
+def _index_values(index, level):
+    values = index.get_level_values(level) if index.nlevels > 1 else index
+    return np.asarray(values, dtype=object)
+
+
+def distinct_students(data, columns):
+    # number of distinct regnums per combination of columns. rows missing a
+    # regnum aren't a student, like nunique() and sql's COUNT(DISTINCT)
+    data = data[data['regnum'].notna()]
+    return (data[columns + ['regnum']].drop_duplicates()
+            .groupby(columns, observed=True, sort=True).size())
+
+
+def _compact(data):
+    # a few rows with the unused categories of the whole frame dropped,
+    # which every groupby over them would otherwise pay for
+    return data.assign(**{column: data[column].cat.remove_unused_categories()
+                          for column in data.columns if data[column].dtype == 'category'})
+
+
+class StudentCube:
+    # distinct student counts for every filter prefix of the dashboard,
+    # computed once at load time. cells map
+    # (key, breakdown column, decision) -> (labels, counts)
+
+    def __init__(self, data, spec=CUBE):
+        self.spec = spec
+        self.cells = {}
+        for (by, split), depths in spec.items():
+            for depth in depths:
+                self._aggregate(data, depth, by, split)
+
+    def updated(self, removed, added):
+        # a copy with some students' rows replaced: removed holds all their
+        # rows before and added all their rows after. distinct counts add up
+        # over disjoint sets of students, so only the cells of those
+        # students change, by the difference of their own counts
+        cube = copy.copy(self)
+        cube.cells = dict(self.cells)
+        before = StudentCube(_compact(removed), self.spec).cells
+        after = StudentCube(_compact(added), self.spec).cells
+        positions = {}
+        for key in before.keys() | after.keys():
+            if key[1] is None:
+                count = (self.cells.get(key, 0) - before.get(key, 0) + after.get(key, 0))
+                cube._set(key, count)
+                continue
+            counts = dict(zip(*self.cells.get(key, ((), ()))))
+            for sign, cells in ((-1, before), (1, after)):
+                for label, count in zip(*cells.get(key, ((), ()))):
+                    counts[label] = counts.get(label, 0) + sign * count
+            if key[1] not in positions:
+                categories = added[key[1]].cat.categories.tolist()
+                positions[key[1]] = {label: i for i, label in enumerate(categories)}
+            cube._set(key, counts, positions[key[1]])
+        return cube
+
+    def _set(self, key, counts, positions=None):
+        # store a recounted cell, labels in category order (positions maps
+        # them to their code), dropping the labels and cells no student is
+        # left in
+        if positions is None:
+            if counts:
+                self.cells[key] = int(counts)
+            else:
+                self.cells.pop(key, None)
+            return
+        labels = sorted((label for label, count in counts.items() if count),
+                        key=positions.__getitem__)
+        if not labels:
+            self.cells.pop(key, None)
+            return
+        self.cells[key] = (np.array(labels, dtype=object),
+                           np.array([counts[label] for label in labels], dtype='int64'))
+
+    def _aggregate(self, data, depth, by, split):
+        group = LEVELS[:depth] + (['decision'] if split else [])
+        columns = group + ([by] if by else [])
+        counts = distinct_students(data, columns)
+        if counts.empty:
+            return
+        keys = [_index_values(counts.index, i) for i in range(len(group))]
+        values = counts.to_numpy()
+        if by is None:
+            for row in range(len(values)):
+                self.cells[tuple(k[row] for k in keys[:depth]), None, None] = int(values[row])
+            return
+        labels = _index_values(counts.index, len(group))
+        if counts.index.nlevels > 1:
+            codes = np.column_stack(counts.index.codes[:len(group)])
+            change = np.flatnonzero((codes[1:] != codes[:-1]).any(axis=1)) + 1
+        else:
+            change = np.array([], dtype=int)
+        starts = np.concatenate([[0], change]).tolist()
+        stops = np.concatenate([change, [len(values)]]).tolist()
+        for start, stop in zip(starts, stops):
+            key = tuple(k[start] for k in keys[:depth])
+            decision = keys[depth][start] if split else None
+            self.cells[key, by, decision] = (labels[start:stop], values[start:stop])
+
+    def counts(self, key, by, decision=None):
+        labels, values = self.cells.get(
+            (tuple(key), by, decision), ((), np.array([], dtype='int64')))
+        return pd.Series(values, index=pd.Index(labels, name=by, dtype=object),
+                         dtype='int64')
+
+    def total(self, key, decision=None):
+        if decision is None:
+            return self.cells.get((tuple(key), None, None), 0)
+        counts = self.counts(key, 'decision')
+        return int(counts.get(decision, 0))
+
+
+# a result counts as a pass from this mark up
+PASS_MARK = 50
+
+
+class ModuleStats:
+    # mark statistics of every module of every programme (results, passes,
+    # pass rate, mean, median, standard deviation and results per grade),
+    # computed in one grouped numpy pass over the marks sorted by
+    # (faculty, programme, module, mark) and split per programme up front.
+    # the pass rates of every faculty are also kept as a dense programme x
+    # module matrix
+
+    def __init__(self, data):
+        self.programmes = {}
+        self.faculties = {}
+        if data.empty:
+            return
+        columns = ['faculty', 'programme', 'module']
+        codes = [data[column].cat.codes.to_numpy().astype('int64')
+                 for column in columns]
+        sizes = [len(data[column].cat.categories) for column in columns]
+        valid = np.all([c >= 0 for c in codes], axis=0)
+        group = np.ravel_multi_index([c[valid] for c in codes], sizes)
+        marks = data['mark'].to_numpy(dtype='float64')[valid]
+        grades = data['grade'].cat.codes.to_numpy()[valid]
+
+        # sorted by group and mark within the group, missing marks last
+        order = np.lexsort((marks, group))
+        group, marks, grades = group[order], marks[order], grades[order]
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        results = np.diff(np.r_[starts, len(group)])
+
+        graded = ~np.isnan(marks)
+        filled = np.where(graded, marks, 0)
+        count = np.add.reduceat(graded, starts)
+        total = np.add.reduceat(filled, starts)
+        squares = np.add.reduceat(filled * filled, starts)
+        passed = np.add.reduceat(marks >= PASS_MARK, starts)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(
+                squares - total * total / count, 0) / (count - 1))
+            # graded marks of a group are sorted, so the median sits in the
+            # middle of them
+            low = starts + np.maximum(count - 1, 0) // 2
+            high = starts + np.maximum(count, 1) // 2
+            median = np.where(count > 0, (marks[low] + marks[high]) / 2, np.nan)
+        pass_rate = passed / results * 100
+
+        grade_labels = data['grade'].cat.categories.tolist()
+        rows = np.repeat(np.arange(len(starts)), results)
+        known = grades >= 0
+        per_grade = np.bincount(
+            rows[known] * len(grade_labels) + grades[known],
+            minlength=len(starts) * len(grade_labels),
+        ).reshape(len(starts), len(grade_labels))
+
+        keys = np.unravel_index(group[starts], sizes)
+        labels = [data[column].cat.categories.take(k)
+                  for column, k in zip(columns, keys)]
+        stats = pd.DataFrame({
+            'results': results,
+            'passed': passed,
+            'pass_rate': pass_rate,
+            'mean': mean,
+            'median': median,
+            'std': std,
+        })
+        stats[grade_labels] = per_grade
+        stats.index = pd.Index(labels[2], name='module')
+
+        programme_starts = np.flatnonzero(
+            np.r_[True, (keys[0][1:] != keys[0][:-1]) | (keys[1][1:] != keys[1][:-1])])
+        programme_stops = np.r_[programme_starts[1:], len(starts)]
+        for start, stop in zip(programme_starts, programme_stops):
+            key = (labels[0][start], labels[1][start])
+            self.programmes[key] = stats.iloc[start:stop]
+
+        # the groups of a faculty are contiguous, scatter their pass rates
+        # into a matrix with a row per programme and a column per module,
+        # both in category order
+        faculty_starts = np.flatnonzero(np.r_[True, keys[0][1:] != keys[0][:-1]])
+        faculty_stops = np.r_[faculty_starts[1:], len(starts)]
+        for start, stop in zip(faculty_starts, faculty_stops):
+            rows, row = np.unique(keys[1][start:stop], return_inverse=True)
+            columns, column = np.unique(keys[2][start:stop], return_inverse=True)
+            rates = np.full((len(rows), len(columns)), np.nan)
+            rates[row, column] = pass_rate[start:stop]
+            self.faculties[labels[0][start]] = pd.DataFrame(
+                rates,
+                index=pd.Index(data['programme'].cat.categories.take(rows), name='programme'),
+                columns=pd.Index(data['module'].cat.categories.take(columns), name='module'))
+
+    def updated(self, data, programmes):
+        # a copy with the (faculty, programme) pairs in programmes recomputed
+        # from data, which holds all their rows, and the pass rate matrices
+        # of their faculties put together again
+        fresh = ModuleStats(data)
+        stats = copy.copy(self)
+        stats.programmes = dict(self.programmes)
+        stats.faculties = dict(self.faculties)
+        for key in programmes:
+            if key in fresh.programmes:
+                stats.programmes[key] = fresh.programmes[key]
+            else:
+                stats.programmes.pop(key, None)
+        for faculty in {faculty for faculty, _ in programmes}:
+            stats._pass_rates(faculty, data['programme'].cat.categories,
+                              data['module'].cat.categories)
+        return stats
+
+    def _pass_rates(self, faculty, programmes, modules):
+        # the programme x module matrix of a faculty from the stats of its
+        # programmes, rows and columns in category order
+        keys = [key for key in self.programmes if key[0] == faculty]
+        if not keys:
+            self.faculties.pop(faculty, None)
+            return
+        rows = np.sort(programmes.get_indexer([programme for _, programme in keys]))
+        columns = np.unique(np.concatenate(
+            [modules.get_indexer(self.programmes[key].index) for key in keys]))
+        rates = np.full((len(rows), len(columns)), np.nan)
+        for row, programme in enumerate(programmes.take(rows)):
+            stats = self.programmes[faculty, programme]
+            at = np.searchsorted(columns, modules.get_indexer(stats.index))
+            rates[row, at] = stats['pass_rate'].to_numpy()
+        self.faculties[faculty] = pd.DataFrame(
+            rates,
+            index=pd.Index(programmes.take(rows), name='programme'),
+            columns=pd.Index(modules.take(columns), name='module'))
+
+    def programme(self, faculty, programme):
+        return self.programmes.get((faculty, programme), _EMPTY_STATS)
+
+    def pass_rates(self, faculty):
+        # programme x module pass rates, nan where a programme has no
+        # results in a module
+        return self.faculties.get(faculty, _EMPTY_RATES)
+
+
+_EMPTY_STATS = pd.DataFrame(
+    columns=['results', 'passed', 'pass_rate', 'mean', 'median', 'std'],
+    index=pd.Index([], name='module', dtype=object))
+_EMPTY_RATES = pd.DataFrame(
+    index=pd.Index([], name='programme', dtype=object),
+    columns=pd.Index([], name='module', dtype=object), dtype='float64')
@@ -0,0 +1,66 @@
+// ui state of the decision table, the student modal and the drilldown back
+// buttons, handled in the browser. only the student details are fetched
+// from the server
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    results: {
+        // clicking a cell selects its row
+        select_active_row: function (active_cell) {
+            return active_cell ? [active_cell.row] : [];
+        },
+
+        // highlight the selected student and open the modal, or close it
+        table_selection: function (selected_row_ids, close_modal_clicks,
+                                   selected_rows, active_cell, selected_cells,
+                                   is_modal_open) {
+            var no_update = window.dash_clientside.no_update;
+            if (selected_row_ids && selected_row_ids.length) {
+                var styles = selected_row_ids.map(function (id) {
+                    return {
+                        'if': {'filter_query': "{id} = '" + id + "'"},
+                        'backgroundColor': 'rgba(0, 116, 217, 0.3)',
+                        'border': '1px solid rgb(0, 116, 217)'
+                    };
+                });
+                styles.push({
+                    'if': {'state': 'active'},
+                    'backgroundColor': 'rgba(0, 116, 217, 0.3)',
+                    'border': '1px solid rgb(0, 116, 217)'
+                });
+                if (active_cell) {
+                    active_cell = Object.assign({}, active_cell, {row: selected_rows[0]});
+                } else {
+                    active_cell = no_update;
+                }
+                return [styles, active_cell, [], true];
+            }
+            if (close_modal_clicks) {
+                return [[], no_update, [], false];
+            }
+            return [[], no_update, [], is_modal_open];
+        },
+
+        // a student picked in the search opens the search modal, clearing
+        // the search or the close button shuts it
+        search_modal: function (regnum, close_clicks) {
+            var triggered = window.dash_clientside.callback_context.triggered;
+            if (triggered.length && triggered[0].prop_id === 'close_search_modal.n_clicks') {
+                return false;
+            }
+            return Boolean(regnum);
+        },
+
+        // the back button shows while a drilldown bar chart replaces the
+        // decision pie
+        back_button_style: function (figure) {
+            var drilled = figure && figure.data && figure.data.length > 0 &&
+                figure.data[0].type === 'bar';
+            return {'display': drilled ? 'block' : 'none'};
+        },
+
+        // a decision pie is on screen, so a filter change may patch it
+        pie_shown: function (figure) {
+            return Boolean(figure && figure.data && figure.data.length > 0 &&
+                figure.data[0].type === 'pie');
+        }
+    }
+});
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from contextvars import copy_context
+
+import numpy as np
+
+from synthetic import write_csv
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# row counts benchmarked by default
+SCALES = [10_000, 1_000_000, 10_000_000]
+# synthetic results are generated once per scale and kept here
+BENCH_DIR = "./data/benchmark"
+# calls timed per callback
+REPEAT = 50
+PERCENTILES = [50, 90, 99]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak_memory_mb():
+    # peak resident set size of this process so far
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def current_memory_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    return value, (time.perf_counter() - start) * 1000
+
+
+def latency(times):
+    times = np.asarray(times)
+    report = {f"p{p}": float(np.percentile(times, p)) for p in PERCENTILES}
+    report['mean'] = float(times.mean())
+    report['calls'] = len(times)
+    return report
+
+
+def triggered(func, trigger, *args):
+    # run a callback as if trigger fired it, for the callbacks that branch
+    # on dash.callback_context
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def run():
+        context_value.set(AttributeDict(
+            triggered_inputs=[{'prop_id': trigger, 'value': None}]))
+        return func(*args)
+    return copy_context().run(run)
+
+
+def bench_callbacks(main, repeat, seed=0):
+    # latency of every callback with the figure caches cleared before each
+    # call, over inputs sampled from the loaded results
+    store = main.store
+    rng = np.random.default_rng(seed)
+    keys = [key for key in store.index.bounds if len(key) == 5]
+    keys = [keys[i] for i in rng.integers(0, len(keys), repeat)]
+    regnums = store.data['regnum'].cat.categories
+    regnums = [regnums[i] for i in rng.integers(0, len(regnums), repeat)]
+
+    def clicked(label):
+        return {'points': [{'label': label}]}
+
+    def decision(key):
+        decisions = store.cube.counts(key, 'decision')
+        return decisions.index[0] if len(decisions) else 'PASS'
+
+    calls = {
+        'update_filters': lambda k, r: triggered(
+            main.update_filters, 'faculty_selection.value', k[0], None, None, None),
+        'generate_chart': lambda k, r: main.generate_chart(k[0]),
+        'gender_distribution': lambda k, r: main.gender_distribution(k[0]),
+        'module_pass_rate': lambda k, r: main.module_pass_rate(k[0], k[1]),
+        'pass_rate_heatmap': lambda k, r: main.pass_rate_heatmap(k[0]),
+        'attendance_type_distribution': lambda k, r: main.attendance_type_distribution(k[0], k[1]),
+        'academicyear_distribution': lambda k, r: main.academicyear_distribution(k[0], k[1]),
+        'decision_drilldown': lambda k, r: triggered(
+            main.decision_drilldown, 'decision_distribution.clickData',
+            clicked(decision(k[:1])), None, k[0], None),
+        'programme_decision_drilldown': lambda k, r: triggered(
+            main.programme_decision_drilldown, 'programme_decision_distribution.clickData',
+            clicked(decision(k)), None, *k, None),
+        'drilldown': lambda k, r: triggered(
+            main.drilldown, 'programme_decision_distribution.clickData',
+            clicked(decision(k)), *k),
+        'decision_table_page': lambda k, r: main.decision_table_page(
+            0, 5, [{'column_id': 'surname', 'direction': 'asc'}], '',
+            {'key': list(k), 'decision': decision(k)}),
+        'update_graphs2': lambda k, r: main.update_graphs2([r]),
+        'student_search_options': lambda k, r: main.student_search_options(str(r)[:4]),
+    }
+    report = {}
+    for name, call in calls.items():
+        times = []
+        for key, regnum in zip(keys, regnums):
+            main.figure_cache.clear()
+            main.student_cache.clear()
+            main.store.subsets.clear()
+            times.append(timed(call, key, regnum)[1])
+        report[name] = latency(times)
+    return report
+
+
+def bench_figures(repeat):
+    # build cost of each chart type through px and through the figure
+    # factory, both ending in the dict memoize caches
+    import pandas as pd
+    import plotly.express as px
+
+    import figures
+
+    decisions = pd.Series([3768, 1257, 894, 306],
+                          index=pd.Index(['PASS', 'PROCEED & CARRY', 'REPEAT', 'DISCONTINUE'],
+                                         name='decision'))
+    modules = pd.Series(np.linspace(90, 40, 48),
+                        index=pd.Index([f"MOD{i:03d}" for i in range(48)], name='module'))
+    codes = pd.Series(np.arange(40, 0, -1) * 10,
+                      index=pd.Index([f"P{i:02d}" for i in range(40)], name='programmecode'))
+
+    def px_donut():
+        fig = px.pie(decisions.reset_index(name='Students'), values='Students',
+                     names='decision', hole=0.3, title="<b>Decision Distribution</b>",
+                     color_discrete_sequence=px.colors.sequential.RdBu)
+        fig.update_layout(height=300, width=300, showlegend=False, template='simple_white')
+        return fig.to_plotly_json()
+
+    def px_top_bar():
+        fig = px.bar(modules.reset_index(name='Pass Rate')[:20], x='module', y='Pass Rate',
+                     title="<b> Pass Rates by Module<b>",
+                     color_discrete_sequence=px.colors.sequential.YlGn_r)
+        fig.update_layout(height=300, width=400, showlegend=False, template='simple_white')
+        fig.update_xaxes(tickangle=45)
+        return fig.to_plotly_json()
+
+    def px_category_bar():
+        fig = px.bar(codes.reset_index(name='Students')[:10], x='programmecode',
+                     y='Students', color='programmecode')
+        fig.update_layout(title="<b>Student Distribution(PASS)<b>", height=300, width=300,
+                          showlegend=False, template='simple_white')
+        fig.update_xaxes(tickangle=45)
+        return fig.to_plotly_json()
+
+    calls = {
+        'donut': (px_donut, lambda: figures.donut(
+            decisions.index, decisions, 'decision', "<b>Decision Distribution</b>",
+            px.colors.sequential.RdBu)),
+        'top_bar': (px_top_bar, lambda: figures.top_bar(
+            modules.index, modules, 'module', 'Pass Rate', "<b> Pass Rates by Module<b>",
+            px.colors.sequential.YlGn_r[0], top=20, width=400, tickangle=45)),
+        'category_bar': (px_category_bar, lambda: figures.category_bar(
+            codes.index, codes, 'programmecode', 'Students',
+            "<b>Student Distribution(PASS)<b>", top=10, tickangle=45)),
+    }
+    report = {}
+    for name, (slow, fast) in calls.items():
+        report[name] = {
+            'px': latency([timed(slow)[1] for _ in range(repeat)]),
+            'factory': latency([timed(fast)[1] for _ in range(repeat)]),
+        }
+    return report
+
+
+def print_figures(report):
+    print(f"  {'figure':16}{'px p50 ms':>12}{'factory p50 ms':>16}{'speedup':>10}")
+    for name, times in report.items():
+        slow, fast = times['px']['p50'], times['factory']['p50']
+        print(f"  {name:16}{slow:12.3f}{fast:16.4f}{slow / fast:9.0f}x")
+
+
+def bench_scale(repeat):
+    # run inside the scale directory, so ./data/new_data.csv is the
+    # synthetic csv and its snapshot lands next to it
+    from dataset import DATA_PATH, SNAPSHOT_DIR, load_dataframe
+    report = {}
+    shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+    data, report['load_csv_ms'] = timed(load_dataframe, DATA_PATH)
+    report['rows'] = len(data)
+    report['frame_mb'] = data.memory_usage(deep=True).sum() / 2**20
+    del data
+    data, report['load_snapshot_ms'] = timed(load_dataframe, DATA_PATH)
+    del data
+    report['load_peak_mb'] = peak_memory_mb()
+
+    start = time.perf_counter()
+    import main
+    report['startup_ms'] = (time.perf_counter() - start) * 1000
+    # the callbacks are timed on a quiet process, after the warm-up
+    main.warmup.wait()
+    report['warmup_ms'] = (main.warmup.seconds or 0) * 1000
+    report['startup_rss_mb'] = current_memory_mb()
+    report['callbacks'] = bench_callbacks(main, repeat)
+    report['peak_mb'] = peak_memory_mb()
+    return report
+
+
+def prepare(rows, directory=BENCH_DIR, seed=0):
+    # the directory a scale runs in, with its synthetic csv
+    scale_dir = os.path.join(directory, str(rows))
+    data_dir = os.path.join(scale_dir, 'data')
+    path = os.path.join(data_dir, 'new_data.csv')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        start = time.perf_counter()
+        write_csv(f"{path}.tmp", rows, seed)
+        os.replace(f"{path}.tmp", path)
+        print(f"generated {rows} rows in {time.perf_counter() - start:.1f}s",
+              file=sys.stderr)
+    return scale_dir
+
+
+def run(rows, repeat=REPEAT, directory=BENCH_DIR):
+    # each scale runs in a fresh interpreter so memory figures don't carry
+    # over from the previous one
+    scale_dir = os.path.abspath(prepare(rows, directory))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [HERE, os.environ.get('PYTHONPATH')])))
+    out = subprocess.run(
+        [sys.executable, os.path.join(HERE, 'benchmark.py'), '--child', '--repeat', str(repeat)],
+        cwd=scale_dir, env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(out.stdout.decode().splitlines()[-1])
+
+
+def print_report(reports):
+    for rows, report in reports.items():
+        print(f"\n{rows} rows ({report['rows']} after dedupe), "
+              f"frame {report['frame_mb']:.1f} MB, "
+              f"startup rss {report['startup_rss_mb']:.0f} MB, "
+              f"peak {report['peak_mb']:.0f} MB")
+        print(f"  load_dataframe csv {report['load_csv_ms']:.0f} ms, "
+              f"snapshot {report['load_snapshot_ms']:.0f} ms, "
+              f"import main {report['startup_ms']:.0f} ms, "
+              f"warm-up {report['warmup_ms']:.0f} ms")
+        print(f"  {'callback':32}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+        for name, times in report['callbacks'].items():
+            print(f"  {name:32}" + "".join(f"{times[f'p{p}']:10.2f}" for p in PERCENTILES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="time load_dataframe and the dashboard callbacks on synthetic results")
+    parser.add_argument('--rows', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--dir', default=BENCH_DIR)
+    parser.add_argument('--json', help="also write the reports to this file")
+    parser.add_argument('--figures', action='store_true',
+                        help="only compare the figure factory with plotly express")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.figures:
+        print_figures(bench_figures(args.repeat))
+    elif args.child:
+        print(json.dumps(bench_scale(args.repeat)))
+    else:
+        reports = {rows: run(rows, args.repeat, args.dir) for rows in args.rows}
+        print_report(reports)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(reports, f, indent=2)
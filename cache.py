@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+
+class LRUCache:
+    # size bounded, thread safe least recently used cache with hit/miss
+    # counters
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def items(self):
+        with self._lock:
+            return list(self._items.items())
+
+    def stats(self):
+        return {'size': len(self._items), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+    def get_or_compute(self, key, compute):
+        # callers asking for the same missing key at the same time wait for
+        # the first one to compute it instead of all computing it
+        value = self.get(key, _missing)
+        if value is not _missing:
+            return value
+        with self._lock:
+            pending = self._pending.setdefault(key, threading.Lock())
+        with pending:
+            value = self.get(key, _missing)
+            if value is _missing:
+                value = compute()
+                self.put(key, value)
+        with self._lock:
+            self._pending.pop(key, None)
+        return value
+
+
+class TTLCache(LRUCache):
+    # LRUCache whose entries also expire ttl seconds after they were stored
+
+    def __init__(self, maxsize=256, ttl=60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires < time.monotonic():
+                del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        super().put(key, (time.monotonic() + self.ttl, value))
+
+
+def _plain(value):
+    if hasattr(value, 'to_plotly_json'):
+        value = value.to_plotly_json()
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def serialize_figure(value):
+    # plotly figures and dash components are kept as plain dicts and lists,
+    # which dash sends as they are and orjson encodes natively. dicts such
+    # as the figure factory's are already plain and kept as they are, so
+    # they go on sharing their template
+    if isinstance(value, tuple):
+        return tuple(serialize_figure(v) for v in value)
+    if hasattr(value, 'to_plotly_json'):
+        return _plain(value)
+    return value
+
+
+def memoize(cache, version=lambda: None, serialize=serialize_figure):
+    # cache func(*args) under (func name, args, version()). the version is
+    # bumped whenever the data behind func changes, so stale entries are
+    # never served
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            key = (func.__qualname__, args, version())
+            try:
+                value = cache.get(key, _missing)
+            except TypeError:
+                # unhashable inputs, just compute
+                return func(*args)
+            if value is _missing:
+                value = serialize(func(*args))
+                cache.put(key, value)
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
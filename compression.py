@@ -0,0 +1,82 @@
+import gzip
+import logging
+
+import flask
+
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    # gzip only, pip install brotli to also offer br
+    brotli = None
+
+# responses smaller than this many bytes are sent as they are
+COMPRESS_MIN_SIZE = 1024
+# gzip level (1-9) and brotli quality (0-11), higher is smaller and slower
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESS_MIMETYPES = {'application/json', 'application/javascript',
+                      'text/javascript', 'text/html', 'text/css', 'text/plain',
+                      'image/svg+xml'}
+# the dash component bundles never change while the server runs, so their
+# compressed bodies are kept
+STATIC_PREFIX = '/_dash-component-suites/'
+STATIC_CACHE_SIZE = 64
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCompressor:
+    # compresses the responses of a flask server with brotli or gzip,
+    # whichever the client accepts (brotli first), and logs the byte counts
+
+    def __init__(self, min_size=COMPRESS_MIN_SIZE, gzip_level=GZIP_LEVEL,
+                 brotli_quality=BROTLI_QUALITY):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.static = LRUCache(STATIC_CACHE_SIZE)
+
+    def init_app(self, server):
+        server.after_request(self.compress)
+
+    def encoding(self):
+        accepted = flask.request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def _compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, self.gzip_level)
+
+    def compress(self, response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESS_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding()
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        path = flask.request.path
+        if path.startswith(STATIC_PREFIX):
+            key = (flask.request.full_path, encoding, len(body))
+            compressed = self.static.get(key)
+            if compressed is None:
+                compressed = self._compress(body, encoding)
+                self.static.put(key, compressed)
+        else:
+            compressed = self._compress(body, encoding)
+            logger.info("%s %d -> %d bytes (%s)", path, len(body), len(compressed), encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
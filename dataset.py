@@ -0,0 +1,769 @@
+import copy
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks on windows, concurrent starts just parse twice
+    fcntl = None
+
+DATA_PATH = "./data/new_data.csv"
+# cleaned copies of the csv live here, keyed on the csv size, mtime and hash.
+# they are uncompressed single chunk arrow files, so every server worker maps
+# the same pages of the os cache instead of holding a private copy. every
+# ingest writes the merged results as the next generation of the snapshot,
+# which the workers map in place of the one before
+SNAPSHOT_DIR = "./data/.snapshot"
+# version of the snapshot layout, see csv_signature
+SNAPSHOT_VERSION = 6
+
+# columns the dashboard uses and how they are held in memory. anything else
+# in the csv (id, mark.1, ...) is never parsed. the text columns repeat the
+# same few values millions of times so they are stored as categoricals,
+# regnum included, which interns every registration number as an integer code
+SCHEMA = {
+    'regnum': 'category',
+    'firstnames': 'category',
+    'surname': 'category',
+    'gender': 'category',
+    'faculty': 'category',
+    'programme': 'category',
+    'programmecode': 'category',
+    'programmetype': 'category',
+    'programmestatus': 'category',
+    'attendancetype': 'category',
+    'academicyear': 'category',
+    'semester': 'category',
+    'module': 'category',
+    'grade': 'category',
+    'decision': 'category',
+    'mark': 'float32',
+}
+
+# the filters of the dashboard, outermost first. the frame is kept sorted on
+# these so every filter combination is one contiguous block of rows
+LEVELS = ['faculty', 'programme', 'attendancetype', 'academicyear', 'semester']
+
+# memory the csv parser may use, in MB. the csv is read in chunks that fit
+# in what the rows already read leave of it, so multi-year archives load on
+# small machines at the cost of a slightly slower parse. dropping duplicates
+# and sorting afterwards work in place on the integer codes and need about
+# 20 bytes per row on top of them
+CSV_MEMORY_BUDGET_MB = 256
+# parser memory per byte of csv text, measured with pandas 2.0
+PARSE_OVERHEAD = 4
+MIN_CHUNK_ROWS = 10_000
+# bytes read from the start of the csv to estimate its line length
+SAMPLE_BYTES = 1 << 20
+# rows numbered and compared at a time when dropping duplicate results
+DEDUPE_BLOCK_ROWS = 1 << 18
+
+logger = logging.getLogger(__name__)
+
+
+def _infer_categories(column):
+    # read_csv hands back string categories, turn them back into numbers
+    # where pandas would have inferred numbers (academicyear, semester, ...)
+    categories = column.cat.categories
+    if categories.dtype != object:
+        return column
+    try:
+        numeric = pd.to_numeric(categories)
+        return column.cat.rename_categories(numeric)
+    except (ValueError, TypeError):
+        return column
+
+
+def _compact_mark(mark):
+    if mark.isna().any() or not (mark == mark.round()).all():
+        return mark.astype('float32')
+    return mark.astype('int16')
+
+
+def compact_dataframe(data):
+    for column, dtype in SCHEMA.items():
+        if column not in data:
+            continue
+        if dtype == 'category':
+            if data[column].dtype != 'category':
+                data[column] = data[column].astype('category')
+            data[column] = _infer_categories(data[column])
+    if 'mark' in data:
+        data['mark'] = _compact_mark(data['mark'])
+    return data
+
+
+def _level_key(data, sizes):
+    # one int64 per row that sorts like LEVELS, missing values last. built
+    # up in place a level at a time from the small integer codes
+    key = np.zeros(len(data), dtype='int64')
+    for column, size in zip(LEVELS, sizes):
+        code = data[column].cat.codes.to_numpy()
+        key *= size + 1
+        key += code
+        key[code < 0] += size + 1
+    return key
+
+
+def sort_dataframe(data):
+    # order the categories by first appearance so sorting keeps the csv
+    # order of faculties, programmes, ... (and so the dropdown defaults)
+    for column in LEVELS:
+        codes = data[column].cat.codes.to_numpy()
+        seen = pd.unique(codes[codes >= 0])
+        order = np.concatenate(
+            [seen, np.setdiff1d(np.arange(len(data[column].cat.categories)), seen)])
+        data[column] = data[column].cat.reorder_categories(
+            data[column].cat.categories[order])
+    # stable, so rows keep their csv order inside every block. the columns
+    # are put in order one at a time, in place, instead of copying the frame
+    sizes = [len(data[column].cat.categories) for column in LEVELS]
+    order = np.argsort(_level_key(data, sizes), kind='stable')
+    for column in data.columns:
+        data[column] = data[column].array.take(order)
+    data.index = pd.RangeIndex(len(data))
+    return data
+
+
+def tidy_dataframe(data):
+    # everything clean_dataframe does after dropping duplicates
+    data['gender'] = data['gender'].replace(
+        {'female': 'Female', 'male': 'Male'})
+    return sort_dataframe(compact_dataframe(data))
+
+
+def clean_dataframe(data):
+    data = data.drop(columns=['mark.1', 'id'], errors='ignore')
+    data = data.drop_duplicates(['regnum', 'module'], keep='last')
+    return tidy_dataframe(data)
+
+# chunked csv parsing
+
+
+def _row_bytes(path):
+    # average csv line length, from the start of the file
+    with open(path, 'rb') as f:
+        sample = f.read(SAMPLE_BYTES)
+    return len(sample) / max(sample.count(b'\n'), 1)
+
+
+def _code_dtype(size):
+    # smallest signed integer type holding the codes of size categories
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class ChunkedColumns:
+    # the rows parsed so far as integer category codes against categories
+    # shared by every chunk, rather than each chunk holding its own copy of
+    # the registration numbers and names as python strings
+
+    def __init__(self):
+        self.columns = None
+        self.categories = {}
+        self.parts = {}
+        self.nbytes = 0
+
+    def append(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.parts = {column: [] for column in self.columns}
+        for column in self.columns:
+            values = chunk[column]
+            if values.dtype != 'category':
+                part = values.to_numpy()
+            else:
+                categories = self.categories.get(column)
+                new = values.cat.categories
+                if categories is None:
+                    categories = new
+                else:
+                    added = new[~new.isin(categories)]
+                    if len(added):
+                        categories = categories.append(added)
+                self.categories[column] = categories
+                # chunk codes -> shared codes, missing values stay -1
+                mapping = np.append(categories.get_indexer(new), -1)
+                dtype = _code_dtype(len(categories))
+                part = mapping.astype(dtype)[values.cat.codes.to_numpy()]
+            self.parts[column].append(part)
+            self.nbytes += part.nbytes
+
+    def _codes(self, column):
+        parts = self.parts.pop(column)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def _last_rows(self, regnum, module):
+        # positions of the last row of every (regnum, module), in csv order
+        rows = len(regnum)
+        key = regnum.astype('int64')
+        key += 1
+        key *= len(self.categories['module']) + 1
+        key += module
+        key += 1
+        if key.max(initial=0) >= np.iinfo(np.int64).max // max(rows, 1):
+            # too many students and modules to number the rows in the key
+            _, last = np.unique(key[::-1], return_index=True)
+            return np.sort(rows - 1 - last)
+        # with the row number in the low digits every key is unique, so one
+        # sort in place puts the rows of a pair together in csv order. the
+        # row numbers and pair comparisons are made a block at a time
+        key *= rows
+        for start in range(0, rows, DEDUPE_BLOCK_ROWS):
+            stop = min(start + DEDUPE_BLOCK_ROWS, rows)
+            key[start:stop] += np.arange(start, stop)
+        key.sort()
+        last = np.ones(rows, dtype=bool)
+        for start in range(0, rows - 1, DEDUPE_BLOCK_ROWS):
+            stop = min(start + DEDUPE_BLOCK_ROWS, rows - 1)
+            np.not_equal(key[start + 1:stop + 1] // rows, key[start:stop] // rows,
+                         out=last[start:stop])
+        key = key[last]
+        key %= rows
+        key.sort()
+        return key
+
+    def frame(self):
+        # the rows as one frame, keeping the last row of every (regnum,
+        # module) across all chunks like drop_duplicates(keep='last'). a
+        # column's chunks are freed once it is gathered
+        codes = {column: self._codes(column) for column in ('regnum', 'module')}
+        keep = self._last_rows(codes['regnum'], codes['module'])
+
+        data = {}
+        for column in self.columns:
+            values = codes.pop(column) if column in codes else self._codes(column)
+            values = values[keep]
+            categories = self.categories.get(column)
+            if categories is not None:
+                # read_csv sorts the categories it parses
+                order = categories.argsort()
+                rank = np.empty(len(order) + 1, dtype=values.dtype)
+                rank[order] = np.arange(len(order))
+                rank[-1] = -1
+                values = pd.Categorical.from_codes(rank[values], categories[order])
+            data[column] = values
+        return pd.DataFrame(data, copy=False)
+
+
+def read_csv(path=DATA_PATH, memory_budget_mb=CSV_MEMORY_BUDGET_MB):
+    # parse the csv a chunk at a time, each chunk sized to what is left of
+    # the memory budget after the codes of the rows already read
+    budget = memory_budget_mb * 2**20
+    row_bytes = _row_bytes(path) * PARSE_OVERHEAD
+    columns = ChunkedColumns()
+    chunks = 0
+    warned = False
+    with pd.read_csv(path, usecols=lambda column: column in SCHEMA,
+                     dtype=SCHEMA, chunksize=MIN_CHUNK_ROWS) as reader:
+        while True:
+            free = budget - columns.nbytes
+            if free < MIN_CHUNK_ROWS * row_bytes and not warned:
+                logger.warning("%s does not fit in %d MB, reading on in chunks of %d rows",
+                               path, memory_budget_mb, MIN_CHUNK_ROWS)
+                warned = True
+            try:
+                chunk = reader.get_chunk(max(int(free // row_bytes), MIN_CHUNK_ROWS))
+            except StopIteration:
+                break
+            columns.append(chunk)
+            chunks += 1
+            del chunk
+    if columns.columns is None:
+        # no rows, just the header
+        data = pd.read_csv(path, usecols=lambda column: column in SCHEMA, dtype=SCHEMA)
+        return clean_dataframe(data)
+    data = columns.frame()
+    logger.info("parsed %s in %d chunks", path, chunks)
+    return tidy_dataframe(data)
+
+# merging new batches
+
+
+def merge_batch(data, batch, students):
+    # merge a cleaned batch into the sorted frame with the same
+    # drop_duplicates(['regnum', 'module'], keep='last') semantics: batch
+    # rows replace the rows of the same student and module. returns the
+    # merged frame, the faculties whose rows changed and the merged frame's
+    # StudentIndex, updated from students
+    if list(batch.columns) != list(data.columns):
+        missing = set(data.columns) ^ set(batch.columns)
+        if missing:
+            raise ValueError(f"batch columns differ from the results: {sorted(missing, key=str)}")
+        batch = batch[data.columns]
+
+    # extend the categories with the new values, old codes stay valid
+    data = data.copy(deep=False)
+    batch = batch.copy(deep=False)
+    for column in data.columns:
+        if data[column].dtype != 'category':
+            continue
+        categories = data[column].cat.categories
+        new = batch[column].astype('category').cat.categories
+        added = new[~new.isin(categories)]
+        if len(added):
+            data[column] = data[column].cat.add_categories(added)
+        batch[column] = batch[column].astype('category').cat.set_categories(
+            data[column].cat.categories)
+
+    # rows superseded by the batch, looked up through the students it touches
+    old_students = len(students.categories)
+    regnums = batch['regnum'].cat.codes.to_numpy()
+    known = np.unique(regnums[(regnums >= 0) & (regnums < old_students)])
+    runs = [students.positions[students.offsets[code]:students.offsets[code + 1]]
+            for code in known.tolist()]
+    candidates = np.concatenate(runs) if runs else np.array([], dtype='int64')
+    modules = len(data['module'].cat.categories)
+
+    def pairs(frame, rows=None):
+        regnum = frame['regnum'].cat.codes.to_numpy().astype('int64')
+        module = frame['module'].cat.codes.to_numpy().astype('int64')
+        if rows is not None:
+            regnum, module = regnum[rows], module[rows]
+        return regnum * (modules + 1) + module
+    superseded = candidates[np.isin(pairs(data, candidates), pairs(batch))]
+
+    faculties = set(batch['faculty'].dropna().unique().tolist())
+    faculties.update(data['faculty'].iloc[superseded].dropna().unique().tolist())
+    keep = np.ones(len(data), dtype=bool)
+    keep[superseded] = False
+    kept = np.flatnonzero(keep)
+
+    # both sides are sorted on LEVELS, so the batch rows slot in after the
+    # existing rows of their block without sorting the frame again
+    sizes = [len(data[column].cat.categories) for column in LEVELS]
+    batch_key = _level_key(batch, sizes)
+    batch_order = np.argsort(batch_key, kind='stable')
+    inserts = np.searchsorted(
+        _level_key(data, sizes)[kept], batch_key[batch_order], side='right')
+    n, m = len(kept), len(batch)
+    order = np.empty(n + m, dtype='int64')
+    order[np.arange(n) + np.searchsorted(inserts, np.arange(n), side='right')] = kept
+    order[inserts + np.arange(m)] = len(data) + batch_order
+
+    # one gather per column from the old rows followed by the batch rows,
+    # on the integer codes of the categoricals
+    merged = {}
+    for column in data.columns:
+        if data[column].dtype == 'category':
+            codes = np.concatenate([data[column].cat.codes.to_numpy(),
+                                    batch[column].cat.codes.to_numpy()])
+            merged[column] = pd.Categorical.from_codes(codes[order], dtype=data[column].dtype)
+        else:
+            values = np.concatenate([data[column].to_numpy(), batch[column].to_numpy()])
+            merged[column] = values[order]
+    merged = pd.DataFrame(merged)
+    where = np.full(len(data) + m, -1, dtype='int64')
+    where[order] = np.arange(n + m)
+    students = students.updated(merged, where[:len(data)], where[len(data):])
+    return merged, faculties, students
+
+# hierarchical index
+
+
+class HierarchicalIndex:
+    # maps every prefix of LEVELS, e.g. (faculty,), (faculty, programme),
+    # ... to the (start, stop) rows it occupies in the sorted frame, so a
+    # filter is a dict lookup and a slice instead of a scan of the frame
+
+    def __init__(self, data, levels=LEVELS):
+        self.data = data
+        self.levels = levels
+        self.bounds = {}
+        codes = np.column_stack(
+            [data[column].cat.codes.to_numpy() for column in levels])
+        categories = [data[column].cat.categories.tolist() for column in levels]
+        for depth in range(1, len(levels) + 1):
+            prefix = codes[:, :depth]
+            change = np.flatnonzero(
+                (prefix[1:] != prefix[:-1]).any(axis=1)) + 1
+            starts = np.concatenate([[0], change]) if len(data) else change
+            stops = np.concatenate([change, [len(data)]])
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                key = tuple(categories[i][code] if code >= 0 else None
+                            for i, code in enumerate(prefix[start]))
+                self.bounds[key] = (start, stop)
+
+    def updated(self, data, removed, added):
+        # a copy for data, the frame after the rows in removed were replaced
+        # by the ones in added. every full key moves by the rows removed and
+        # added before it, so the bounds are summed up again from the row
+        # counts of the full keys instead of rescanning the frame
+        index = copy.copy(self)
+        index.data, index.bounds = data, {}
+        depth = len(self.levels)
+        counts = {key: stop - start for key, (start, stop) in self.bounds.items()
+                  if len(key) == depth}
+        for rows, sign in ((removed, -1), (added, 1)):
+            values = zip(*(rows[column].tolist() for column in self.levels))
+            for key in values:
+                key = tuple(None if value != value else value for value in key)
+                counts[key] = counts.get(key, 0) + sign
+
+        # full keys in frame order: by category code, missing values last
+        categories = [data[column].cat.categories for column in self.levels]
+        positions = [{value: i for i, value in enumerate(values.tolist())}
+                     for values in categories]
+
+        def rank(key):
+            return tuple(len(categories[i]) if value is None else positions[i][value]
+                         for i, value in enumerate(key))
+        levels = [{} for _ in range(depth)]
+        start = 0
+        for key in sorted((key for key, count in counts.items() if count), key=rank):
+            stop = start + counts[key]
+            for i in range(depth):
+                bounds = levels[i].get(key[:i + 1])
+                levels[i][key[:i + 1]] = (bounds[0] if bounds else start, stop)
+            start = stop
+        for bounds in levels:
+            index.bounds.update(bounds)
+        return index
+
+    def slice(self, *key):
+        start, stop = self.bounds.get(key, (0, 0))
+        return self.data.iloc[start:stop]
+
+    def select(self, keys):
+        # the rows of several keys, in key order
+        runs = [np.arange(*self.bounds.get(key, (0, 0))) for key in keys]
+        return self.data.iloc[np.concatenate(runs) if runs else []]
+
+
+class StudentIndex:
+    # the rows of every student as one contiguous run of positions.
+    # positions lists the frame rows ordered by regnum code and
+    # positions[offsets[c]:offsets[c + 1]] are the rows of code c, so a
+    # lookup is a hash of the regnum plus a slice
+
+    def __init__(self, data):
+        self.data = data
+        self.categories = data['regnum'].cat.categories
+        codes = data['regnum'].cat.codes.to_numpy()
+        self.positions = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0],
+                             minlength=len(self.categories))
+        # missing regnums (code -1) sort first, skip past them
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+
+    def updated(self, data, moved, added):
+        # the index of data, merged from this index's frame and a batch:
+        # moved holds the new position of every old row (-1 if superseded)
+        # and added those of the batch rows. the old runs keep their order
+        # and the batch rows are slotted into them, instead of sorting every
+        # row of the frame again
+        index = copy.copy(self)
+        index.data = data
+        index.categories = data['regnum'].cat.categories
+        # rows per code of the kept rows, the missing regnums first
+        size = len(index.categories) + 1
+        counts = np.zeros(size, dtype='int64')
+        counts[:len(self.offsets)] = np.diff(self.offsets, prepend=0)
+        removed = self.data['regnum'].cat.codes.to_numpy()[moved < 0]
+        counts -= np.bincount(removed.astype('int64') + 1, minlength=size)
+        kept = moved[self.positions]
+        kept = kept[kept >= 0]
+        # kept is ordered on (code, position), find the batch rows' places
+        # in that order from the run lengths rather than the codes of every row
+        codes = data['regnum'].cat.codes.to_numpy()[added].astype('int64')
+        order = np.lexsort((added, codes))
+        added, codes = added[order], codes[order]
+        scale = len(data) + 1
+        kept_codes = np.repeat(np.arange(-1, size - 1), counts)
+        inserts = np.searchsorted(kept_codes * scale + kept, codes * scale + added)
+        index.positions = np.insert(kept, inserts, added)
+        counts += np.bincount(codes + 1, minlength=size)
+        index.offsets = np.cumsum(counts)
+        return index
+
+    def rows(self, regnum):
+        try:
+            code = self.categories.get_loc(regnum)
+        except KeyError:
+            return self.data.iloc[0:0]
+        return self.data.iloc[self.positions[self.offsets[code]:self.offsets[code + 1]]]
+
+    def select(self, regnums):
+        # the rows of every student in regnums, plus the rows missing a
+        # regnum when some of regnums are missing
+        codes = self.categories.get_indexer(regnums.dropna().unique())
+        runs = [self.positions[self.offsets[code]:self.offsets[code + 1]]
+                for code in codes[codes >= 0].tolist()]
+        if regnums.isna().any():
+            runs.append(self.positions[:self.offsets[0]])
+        if not runs:
+            return self.data.iloc[0:0]
+        return self.data.iloc[np.concatenate(runs)]
+
+
+class OptionTree:
+    # the dropdown cascade faculty -> programme -> attendancetype ->
+    # academicyear -> semester as nested dicts, built once from level keys
+    # in frame order (e.g. the index bounds) so the options come out in
+    # that order
+
+    def __init__(self, keys):
+        self.tree = {}
+        for key in keys:
+            node = self.tree
+            for value in key:
+                node = node.setdefault(value, {})
+
+    def options(self, *key):
+        node = self.tree
+        for value in key:
+            node = node.get(value)
+            if node is None:
+                return []
+        return list(node)
+
+    def semesters(self, faculty, programme, attendancetype):
+        # semesters are offered across all the academic years of an
+        # attendance type
+        years = self.tree.get(faculty, {}).get(
+            programme, {}).get(attendancetype, {})
+        return list(dict.fromkeys(
+            semester for year in years.values() for semester in year))
+
+# memory report
+
+
+def object_memory_usage(data):
+    # what the frame would cost with plain object/int64 columns, computed
+    # from the category counts instead of materialising the strings
+    total = data.index.memory_usage()
+    for column in data.columns:
+        values = data[column]
+        if values.dtype == 'category' and values.cat.categories.dtype == object:
+            counts = np.bincount(values.cat.codes[values.cat.codes >= 0],
+                                 minlength=len(values.cat.categories))
+            sizes = np.array([sys.getsizeof(v) for v in values.cat.categories])
+            total += 8 * len(values) + int((counts * sizes).sum())
+        else:
+            total += 8 * len(values)
+    return total
+
+
+def log_memory_usage(data):
+    before = object_memory_usage(data)
+    after = int(data.memory_usage(deep=True).sum())
+    logger.info("results frame: %d rows, %.1f MB as objects, %.1f MB compact",
+                len(data), before / 2**20, after / 2**20)
+
+# snapshot cache
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_paths(path, snapshot_dir=SNAPSHOT_DIR, generation=0):
+    # the frame of a generation of the snapshot and the meta it is checked
+    # against
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(snapshot_dir, f"{name}.{generation}.feather"),
+            os.path.join(snapshot_dir, f"{name}.json"))
+
+
+def snapshot_generations(path, snapshot_dir=SNAPSHOT_DIR):
+    # the generations of the snapshot on disk, oldest first
+    name = os.path.splitext(os.path.basename(path))[0]
+    generations = []
+    for frame_path in glob.glob(os.path.join(glob.escape(snapshot_dir), f"{name}.*.feather")):
+        try:
+            generations.append(int(os.path.basename(frame_path)[len(name) + 1:-len(".feather")]))
+        except ValueError:
+            continue
+    return sorted(generations)
+
+
+def _write_json(path, meta):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def write_feather(data, path):
+    # uncompressed and in one chunk so it can be mapped. written to a
+    # temporary name first so workers starting at the same time never see a
+    # half written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(data.reset_index(drop=True), tmp,
+                          compression='uncompressed',
+                          chunksize=max(len(data), 1))
+    os.replace(tmp, path)
+
+
+def map_feather(path):
+    # numeric columns and category codes stay views into the mapping, only
+    # the category values are copied
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def csv_signature(path, version, stat=None):
+    # what files built from the csv are checked against before they are
+    # reused: its size and mtime and the version of the format they were
+    # written in, which is bumped whenever the cleaning steps or their
+    # layout change so old ones get rebuilt
+    stat = stat or os.stat(path)
+    return {'version': version, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def read_snapshot(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    _, meta_path = snapshot_paths(path, snapshot_dir)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(path)
+    if meta.get('version') != SNAPSHOT_VERSION or meta.get('size') != stat.st_size:
+        return None
+    if meta.get('mtime') != stat.st_mtime_ns:
+        # the csv was touched or copied, only reuse the snapshot if the
+        # content is still the same
+        if meta.get('sha256') != file_hash(path):
+            return None
+        meta['mtime'] = stat.st_mtime_ns
+        try:
+            _write_json(meta_path, meta)
+        except OSError:
+            pass
+    generation = None
+    while True:
+        generations = snapshot_generations(path, snapshot_dir)
+        if not generations or generations[-1] == generation:
+            return None
+        generation = generations[-1]
+        frame_path, _ = snapshot_paths(path, snapshot_dir, generation)
+        try:
+            return map_feather(frame_path)
+        except FileNotFoundError:
+            # an ingest wrote the next generation and removed this one since
+            # we listed them
+            continue
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("ignoring unreadable snapshot %s: %s", frame_path, e)
+            return None
+
+
+def write_generation(data, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # write data as the next generation of the snapshot and map it back.
+    # the workers still mapping the older generations keep their pages, the
+    # files are only unlinked
+    generations = snapshot_generations(path, snapshot_dir)
+    generation = generations[-1] + 1 if generations else 0
+    frame_path, _ = snapshot_paths(path, snapshot_dir, generation)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    write_feather(data, frame_path)
+    for old in generations:
+        try:
+            os.remove(snapshot_paths(path, snapshot_dir, old)[0])
+        except OSError:
+            pass
+    return map_feather(frame_path)
+
+
+def write_snapshot(data, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, stat=None):
+    _, meta_path = snapshot_paths(path, snapshot_dir)
+    meta = dict(csv_signature(path, SNAPSHOT_VERSION, stat), sha256=file_hash(path))
+    mapped = write_generation(data, path, snapshot_dir)
+    _write_json(meta_path, meta)
+    return mapped
+
+
+@contextmanager
+def file_lock(lock_path):
+    # an exclusive advisory lock on lock_path, held across the worker
+    # processes. without one (no fcntl, or the file can't be opened) the
+    # callers go ahead unlocked
+    try:
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+        f = open(lock_path, 'w')
+    except OSError as e:
+        logger.warning("could not lock %s: %s", lock_path, e)
+        f = None
+    if f is None or fcntl is None:
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def snapshot_lock(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # held while a snapshot is built, so of several workers starting
+    # together one parses the csv and the others wait and map its snapshot
+    _, meta_path = snapshot_paths(path, snapshot_dir)
+    return file_lock(f"{os.path.splitext(meta_path)[0]}.lock")
+
+
+def build_snapshot(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # stat before parsing so a csv modified while we read it is rebuilt
+    # again on the next start
+    stat = os.stat(path)
+    data = read_csv(path)
+    try:
+        # serve from the mapping like every other worker
+        mapped = write_snapshot(data, path, snapshot_dir, stat)
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning("could not write snapshot of %s: %s", path, e)
+        return data
+    logger.info("wrote snapshot of %s (%d rows)", path, len(data))
+    return mapped
+
+
+def publish_once(read, build, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # what read() finds built from the csv, or build() gives when it finds
+    # nothing current. of several workers starting together one builds under
+    # the snapshot lock, the others wait for it and read what it built
+    value = read()
+    if value is None:
+        with snapshot_lock(path, snapshot_dir):
+            value = read()
+            if value is None:
+                value = build()
+    return value
+
+
+def publish_snapshot(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # the cleaned results mapped from their snapshot, built first if it is
+    # missing or stale
+    data = publish_once(lambda: read_snapshot(path, snapshot_dir),
+                        lambda: build_snapshot(path, snapshot_dir), path, snapshot_dir)
+    logger.info("loaded %d rows from snapshot of %s", len(data), path)
+    return data
+
+
+def load_dataframe(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    data = publish_snapshot(path, snapshot_dir)
+    log_memory_usage(data)
+    return data
+
+
+if __name__ == "__main__":
+    # publish the snapshot ahead of starting the server workers
+    logging.basicConfig(level=logging.INFO)
+    publish_snapshot()
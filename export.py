@@ -0,0 +1,91 @@
+import re
+import tempfile
+from urllib.parse import urlencode
+
+import flask
+from openpyxl import Workbook
+
+from dataset import LEVELS
+
+# rows written per chunk of a streamed export
+EXPORT_CHUNK_ROWS = 5000
+# xlsx files are zip archives, so they are written to a temporary file that
+# stays in memory up to this many bytes and is then streamed in blocks
+XLSX_SPOOL_BYTES = 8 << 20
+EXPORT_BLOCK_BYTES = 1 << 16
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_url(key, decision=None, fmt='csv'):
+    # link to the decision list of a filter selection, all decisions if
+    # decision is None
+    params = dict(zip(LEVELS, key))
+    if decision is not None:
+        params['decision'] = decision
+    return f"/export/decisions.{fmt}?{urlencode(params)}"
+
+
+def _key(store, args):
+    # the filter selection of the query string, matched against the
+    # dropdown options so numbers come back as numbers
+    key = []
+    for level in LEVELS:
+        if level not in args:
+            break
+        options = {str(option): option for option in store.options.options(*key)}
+        if args[level] not in options:
+            flask.abort(404)
+        key.append(options[args[level]])
+    if not key:
+        flask.abort(400)
+    return tuple(key)
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+        yield rows.iloc[start:start + EXPORT_CHUNK_ROWS]
+
+
+def _csv(rows):
+    yield rows.iloc[0:0].to_csv(index=False)
+    for chunk in _chunks(rows):
+        yield chunk.to_csv(index=False, header=False)
+
+
+def _xlsx(rows):
+    # write_only keeps one row in memory at a time
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('decisions')
+    sheet.append([str(column) for column in rows.columns])
+    for chunk in _chunks(rows):
+        for row in chunk.astype(object).itertuples(index=False, name=None):
+            sheet.append([None if value != value else value for value in row])
+    with tempfile.SpooledTemporaryFile(XLSX_SPOOL_BYTES) as f:
+        workbook.save(f)
+        f.seek(0)
+        yield from iter(lambda: f.read(EXPORT_BLOCK_BYTES), b'')
+
+
+def init_app(server, store):
+    # /export/decisions.csv and .xlsx?faculty=...&programme=...&decision=...
+    # stream the one row per student decision lists of a filter selection
+    writers = {'csv': _csv, 'xlsx': _xlsx}
+
+    def decisions(fmt):
+        if fmt not in writers:
+            flask.abort(404)
+        key = _key(store, flask.request.args)
+        rows = store.roster(*key)
+        decision = flask.request.args.get('decision')
+        if decision is not None:
+            rows = rows[rows['decision'] == decision]
+        rows = rows.drop(columns='id')
+        name = '_'.join(str(value) for value in key + ((decision,) if decision else ()))
+        name = re.sub(r'[^\w.-]+', '_', name, flags=re.ASCII)
+        return flask.Response(
+            flask.stream_with_context(writers[fmt](rows)), mimetype=MIMETYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{name}.{fmt}"'})
+    server.add_url_rule('/export/decisions.<fmt>', 'export_decisions', decisions)
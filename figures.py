@@ -0,0 +1,172 @@
+import plotly.io as pio
+
+# figure dicts for the dashboard's chart types, built straight from the
+# aggregated labels and counts. they match what px.pie / px.bar followed by
+# update_layout(template='simple_white', ...) produce, without px
+# validating a dataframe, resolving the template and building traces on
+# every call
+
+# resolved once and shared by every figure, nothing modifies it
+TEMPLATE = pio.templates['simple_white'].to_plotly_json()
+# px colours one trace per category from the default template's colorway
+CATEGORY_COLORS = list(pio.templates[pio.templates.default].layout.colorway)
+
+
+def _list(values):
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
+def _axes(x_name, y_name, tickangle=None):
+    xaxis = {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': x_name}}
+    if tickangle is not None:
+        xaxis['tickangle'] = tickangle
+    yaxis = {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': y_name}}
+    return xaxis, yaxis
+
+
+def donut(labels, values, names, title, colors, values_name='Students',
+          hole=0.3, height=300, width=300):
+    # px.pie(values=values_name, names=names, hole=hole, title=title,
+    # color_discrete_sequence=colors) without a legend
+    return {
+        'data': [{
+            'domain': {'x': [0.0, 1.0], 'y': [0.0, 1.0]},
+            'hole': hole,
+            'hovertemplate': f"{names}=%{{label}}<br>{values_name}=%{{value}}<extra></extra>",
+            'labels': _list(labels),
+            'legendgroup': '',
+            'name': '',
+            'showlegend': True,
+            'values': _list(values),
+            'type': 'pie',
+        }],
+        'layout': {
+            'template': TEMPLATE,
+            'legend': {'tracegroupgap': 0},
+            'title': {'text': title},
+            'piecolorway': list(colors),
+            'height': height,
+            'width': width,
+            'showlegend': False,
+        },
+    }
+
+
+def top_bar(x, y, x_name, y_name, title, color, top=None, height=300,
+            width=300, tickangle=None):
+    # px.bar(x=x_name, y=y_name, title=title, color_discrete_sequence=[color])
+    # of the first top bars, in one trace
+    x, y = _list(x)[:top], _list(y)[:top]
+    xaxis, yaxis = _axes(x_name, y_name, tickangle)
+    return {
+        'data': [{
+            'alignmentgroup': 'True',
+            'hovertemplate': f"{x_name}=%{{x}}<br>{y_name}=%{{y}}<extra></extra>",
+            'legendgroup': '',
+            'marker': {'color': color, 'pattern': {'shape': ''}},
+            'name': '',
+            'offsetgroup': '',
+            'orientation': 'v',
+            'showlegend': False,
+            'textposition': 'auto',
+            'x': x,
+            'xaxis': 'x',
+            'y': y,
+            'yaxis': 'y',
+            'type': 'bar',
+        }],
+        'layout': {
+            'template': TEMPLATE,
+            'xaxis': xaxis,
+            'yaxis': yaxis,
+            'legend': {'tracegroupgap': 0},
+            'title': {'text': title},
+            'barmode': 'relative',
+            'height': height,
+            'width': width,
+            'showlegend': False,
+        },
+    }
+
+
+def category_bar(x, y, x_name, y_name, title, top=None, height=300,
+                 width=300, tickangle=None):
+    # px.bar(x=x_name, y=y_name, color=x_name) of the first top bars, sorted
+    # as given: one trace and colour per category
+    x, y = _list(x)[:top], _list(y)[:top]
+    xaxis, yaxis = _axes(x_name, y_name, tickangle)
+    xaxis['categoryorder'] = 'array'
+    xaxis['categoryarray'] = x
+    hovertemplate = f"{x_name}=%{{x}}<br>{y_name}=%{{y}}<extra></extra>"
+    return {
+        'data': [{
+            'alignmentgroup': 'True',
+            'hovertemplate': hovertemplate,
+            'legendgroup': str(label),
+            'marker': {'color': CATEGORY_COLORS[i % len(CATEGORY_COLORS)],
+                       'pattern': {'shape': ''}},
+            'name': str(label),
+            'offsetgroup': str(label),
+            'orientation': 'v',
+            'showlegend': True,
+            'textposition': 'auto',
+            'x': [label],
+            'xaxis': 'x',
+            'y': [value],
+            'yaxis': 'y',
+            'type': 'bar',
+        } for i, (label, value) in enumerate(zip(x, y))],
+        'layout': {
+            'template': TEMPLATE,
+            'xaxis': xaxis,
+            'yaxis': yaxis,
+            # px only titles the legend when there are traces
+            'legend': ({'title': {'text': x_name}, 'tracegroupgap': 0} if x
+                       else {'tracegroupgap': 0}),
+            'margin': {'t': 60},
+            'barmode': 'relative',
+            'title': {'text': title},
+            'height': height,
+            'width': width,
+            'showlegend': False,
+        },
+    }
+
+
+def heatmap(x, y, z, x_name, y_name, z_name, title, colors, zmin=None,
+            zmax=None, height=300):
+    # px.imshow(z, x=x, y=y, aspect='auto', zmin=zmin, zmax=zmax,
+    # color_continuous_scale=colors) with x_name, y_name and z_name as the
+    # labels. missing cells stay blank
+    coloraxis = {
+        'colorbar': {'title': {'text': z_name}},
+        'colorscale': [[i / (len(colors) - 1), color] for i, color in enumerate(colors)],
+    }
+    if zmin is not None:
+        coloraxis['cmin'] = zmin
+    if zmax is not None:
+        coloraxis['cmax'] = zmax
+    xaxis, yaxis = _axes(x_name, y_name)
+    yaxis['autorange'] = 'reversed'
+    return {
+        'data': [{
+            'coloraxis': 'coloraxis',
+            'name': '0',
+            'x': _list(x),
+            'y': _list(y),
+            'z': [[None if value != value else value for value in row] for row in _list(z)],
+            'type': 'heatmap',
+            'xaxis': 'x',
+            'yaxis': 'y',
+            'hovertemplate': (f"{x_name}: %{{x}}<br>{y_name}: %{{y}}<br>"
+                              f"{z_name}: %{{z}}<extra></extra>"),
+        }],
+        'layout': {
+            'template': TEMPLATE,
+            'xaxis': xaxis,
+            'yaxis': yaxis,
+            'coloraxis': coloraxis,
+            'title': {'text': title},
+            'height': height,
+        },
+    }
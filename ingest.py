@@ -0,0 +1,125 @@
+import glob
+import logging
+import os
+import threading
+import time
+
+from dataset import file_lock, read_csv
+
+# new result batches are dropped here as csv files with the columns of the
+# results file
+INCOMING_DIR = "./data/incoming"
+# subdirectories of the drop directory that batches are moved to, once
+# merged or once they failed to
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+# seconds between scans of the drop directory
+POLL_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWatcher(threading.Thread):
+    # polls the drop directory and merges every new or changed csv into the
+    # store. a file is only picked up once its size and mtime held still for
+    # a whole poll, so half copied files are left alone.
+    #
+    # every store writes its ingests to files all the workers serve from
+    # (the snapshot, the database or the partitions). a batch is claimed
+    # under a lock on the drop directory by the first worker to see it,
+    # merged once and moved to processed/ (failed/ if it could not be), so
+    # restarts don't pick it up again, and the other workers reload the
+    # store when batches they didn't merge turn up there
+
+    def __init__(self, store, directory=INCOMING_DIR, interval=POLL_INTERVAL):
+        super().__init__(name="batch-watcher", daemon=True)
+        self.store = store
+        self.directory = directory
+        self.interval = interval
+        self.seen = {}
+        # batches in processed/ the store already holds
+        self.processed = self._listing(PROCESSED_DIR)
+        self._pending = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self):
+        paths = self._stable()
+        with file_lock(os.path.join(self.directory, ".ingest.lock")):
+            # catch up with the other workers' batches before merging on top
+            self._refresh()
+            for path in paths:
+                self._claim(path)
+
+    def _stable(self):
+        # the new or changed files that held still since the last poll
+        stable = []
+        paths = glob.glob(os.path.join(self.directory, "*.csv"))
+        for path in sorted(paths, key=_mtime):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self.seen.get(path) == signature:
+                continue
+            if self._pending.get(path) != signature:
+                self._pending[path] = signature
+                continue
+            del self._pending[path]
+            self.seen[path] = signature
+            stable.append(path)
+        return stable
+
+    def _ingest(self, path):
+        try:
+            self.store.ingest(read_csv(path))
+        except Exception:
+            logger.exception("could not ingest %s", path)
+            return False
+        logger.info("ingested batch %s", path)
+        return True
+
+    def _claim(self, path):
+        # merge a batch unless another worker moved it away first
+        if not os.path.exists(path):
+            return
+        done = self._ingest(path)
+        name = f"{time.time_ns()}-{os.path.basename(path)}"
+        folder = os.path.join(self.directory, PROCESSED_DIR if done else FAILED_DIR)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            os.replace(path, os.path.join(folder, name))
+        except OSError:
+            logger.exception("could not move %s to %s", path, folder)
+            return
+        if done:
+            self.processed.add(name)
+
+    def _refresh(self):
+        # reload the store after batches the other workers merged
+        processed = self._listing(PROCESSED_DIR)
+        if processed - self.processed:
+            logger.info("reloading after %d batches ingested by other workers",
+                        len(processed - self.processed))
+            self.processed = processed
+            self.store.reload()
+
+    def _listing(self, folder):
+        try:
+            return set(os.listdir(os.path.join(self.directory, folder)))
+        except OSError:
+            return set()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
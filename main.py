@@ -1,24 +1,64 @@
-import pandas as pd
+import logging
+import os
 import dash
 import dash_bootstrap_components as dbc
-from dash import html, dcc, callback, dash_table, no_update, State
-from dash.dependencies import Output, Input
+from dash import html, dcc, callback, dash_table, no_update, Patch, State
+from dash.dependencies import ClientsideFunction, Output, Input
 import plotly.express as px
+import plotly.io as pio
+
+import export
+import figures
+from cache import LRUCache, memoize
+from compression import ResponseCompressor
+from ingest import INCOMING_DIR, BatchWatcher
+from metrics import CallbackMetrics
+from partitions import PartitionedStore
+from sqlstore import SqliteStore
+from store import ResultsStore
+from tables import filter_frame, page_count, page_frame, sort_frame
+from warmup import CacheWarmer
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+# dash serialises callback responses through plotly, orjson encodes the
+# figure dicts and table records several times faster than json
+pio.json.config.default_engine = 'orjson'
+
+# most recently used figures, keyed on the callback inputs and the version
+# of the results they were built from. the cache grows by the figures the
+# warm-up builds, this many are left for the views built on demand
+FIGURE_CACHE_SIZE = 512
+
+# where the results are served from: 'pandas' holds the cleaned frame and
+# its aggregates in memory, 'sqlite' queries an indexed database built next
+# to the csv (python sqlstore.py builds it ahead of starting the server),
+# 'partitioned' maps the year/semester files a view needs (python
+# partitions.py builds them)
+RESULTS_BACKEND = 'pandas'
+STORES = {'pandas': ResultsStore, 'sqlite': SqliteStore,
+          'partitioned': PartitionedStore}
+
+store = STORES[RESULTS_BACKEND]()
+figure_cache = LRUCache(FIGURE_CACHE_SIZE)
+store.listeners.append(lambda store: figure_cache.clear())
+cached_figure = memoize(figure_cache, lambda: store.version)
+
+# prebuilt student modal bodies
+STUDENT_CACHE_SIZE = 1024
+
+student_cache = LRUCache(STUDENT_CACHE_SIZE)
+store.listeners.append(lambda store: student_cache.clear())
+cached_student = memoize(student_cache, lambda: store.version)
+
+# merge result batches dropped into the incoming directory while running
+if os.path.isdir(INCOMING_DIR):
+    BatchWatcher(store).start()
 
-
-def load_dataframe():
-    data = pd.read_csv("./data/new_data.csv")
-    data = data.drop(columns=['mark.1', 'id'])
-    data = data.drop_duplicates(['regnum', 'module'], keep='last')
-    data['gender'] = data['gender'].replace(
-        {'female': 'Female', 'male': 'Male'})
-    return data
-
-
-data = load_dataframe()
 # list all unique faculties
-faculties = data.faculty.unique().tolist()
-programmes = data[data['faculty'] == faculties[0]].programme.unique().tolist()
+faculties = store.options.options()
+programmes = store.options.options(faculties[0])
 
 # create a faculty select box
 faculty = dcc.Dropdown(
@@ -26,12 +66,17 @@ faculty = dcc.Dropdown(
 programme = dcc.Dropdown(id='programme_selection',
                          options=programmes, value=programmes[0])
 
+# find a student by regnum or name, the options are looked up on the server
+# as the user types
+student_search = dcc.Dropdown(
+    id='student_search', options=[],
+    placeholder='Search students by registration number or name')
+
 # faculty infomation cards
 
 
 def faculty_decision_distribution(faculty=faculties[0]):
-    df = data[data['faculty'] == faculty]
-    grouped_data = df.groupby(by="decision")['regnum'].nunique()
+    grouped_data = store.cube.counts((faculty,), 'decision')
     grouped_data = grouped_data.reset_index(
         name="Students")
     fig = px.bar(
@@ -54,8 +99,8 @@ def faculty_decision_distribution(faculty=faculties[0]):
 def dash_datatable():
 
     datatable = dash_table.DataTable(
-        data[data['faculty'] == faculty].to_dict('records'),
-        columns=[{"name": i, "id": i} for i in data.columns[:-2]],
+        store.data[store.data['faculty'] == faculty].to_dict('records'),
+        columns=[{"name": i, "id": i} for i in store.data.columns[:-2]],
         row_selectable='single',
         cell_selectable=True,
         style_data_conditional=[
@@ -79,13 +124,31 @@ def dash_datatable():
     return datatable
 
 
+# student details, opened from the decision table and from the search
+
+
+def student_modal(modal_id, body_id, close_id):
+    return dbc.Modal(
+        [
+            dbc.ModalHeader("Student Information"),
+            dbc.ModalBody(id=body_id),
+            dbc.ModalFooter(
+                dbc.Button("Close", id=close_id,
+                           className="ml-auto", n_clicks=0, size='sm')
+            ),
+        ],
+        id=modal_id,
+        size="lg",
+    )
+
+
 # statistical cards
 
 
 def faculty_cards(faculty=faculties[0]):
-    decisions = data[data['faculty'] == faculty].decision.unique().tolist()
+    decisions = store.cube.counts((faculty,), 'decision')
     cards = []
-    for decision in decisions:
+    for decision, students in decisions.items():
         new_card = dbc.Card(
             dbc.CardBody(
                 [
@@ -93,7 +156,7 @@ def faculty_cards(faculty=faculties[0]):
                             f"{decision}"], className="text-nowrap"),
                     html.I(className='fa-solid fa-users me-2'),
                     html.Span(
-                        f"{data[(data['decision']== decision) & (data['faculty']== faculty)].regnum.nunique()}", className=""),
+                        f"{students}", className=""),
                 ], className="border-start border-success border-5"
             ),
             className=""
@@ -113,6 +176,28 @@ app = dash.Dash(
     suppress_callback_exceptions=True,
     external_stylesheets=[dbc.themes.MATERIA, dbc.icons.FONT_AWESOME],
 )
+# the flask app for wsgi servers, e.g. gunicorn -w 4 main:server. the
+# workers map the one results snapshot written by `python dataset.py` (or by
+# whichever worker starts first) rather than each parsing the csv
+server = app.server
+
+# gzip (or brotli, if installed) responses over COMPRESS_MIN_SIZE bytes.
+# registered before the metrics, so the payload histogram still records the
+# uncompressed sizes
+ResponseCompressor().init_app(server)
+
+# csv and xlsx downloads of the decision lists, linked from the decision
+# table
+export.init_app(server, store)
+
+# latency, phase and payload histograms of every callback, served at
+# /metrics. set a number of seconds to also log slower callbacks with their
+# inputs
+SLOW_CALLBACK_SECONDS = None
+
+metrics = CallbackMetrics(SLOW_CALLBACK_SECONDS)
+metrics.instrument(app)
+phase = metrics.phase
 
 
 sidebar = html.Div(
@@ -171,6 +256,10 @@ app.layout = html.Div(
         ),
         html.Div(
             [
+                student_search,
+                student_modal('search_modal', 'search_modal_body',
+                              'close_search_modal'),
+                html.Br(),
                 faculty,
                 html.Br(),
                 dbc.Container(
@@ -187,7 +276,8 @@ app.layout = html.Div(
                                 dbc.Row(
                                     dcc.Graph(id="decision_distribution"),
                                     justify='center'
-                                )
+                                ),
+                                dcc.Store(id='decision_pie_shown', data=False)
                             ])
                         ]
                     ),
@@ -196,6 +286,11 @@ app.layout = html.Div(
                 html.Br(),
                 # faculty_cards(),
                 # html.Br(),
+                dbc.Container(
+                    dcc.Graph(id="pass_rate_heatmap"),
+                    fluid=True,
+                ),
+                html.Br(),
                 programme,
                 html.Br(),
                 dbc.Container(
@@ -237,7 +332,8 @@ app.layout = html.Div(
                                 dcc.Graph(
                                     id="programme_decision_distribution"),
                                 justify='center'
-                            )
+                            ),
+                            dcc.Store(id='programme_decision_pie_shown', data=False)
 
                         ]),
                     ]),
@@ -260,68 +356,59 @@ app.layout = html.Div(
 
 
 # callbacks
-@app.callback(
-    output=[Output('programme_selection', 'options'),
-            Output('programme_selection', 'value')],
-    inputs=[Input('faculty_selection', 'value')])
-def update_programme(value):
-    options = data[data['faculty'] == value].programme.unique().tolist()
-    value = options[0]
-    return options, value
-
-# attendance types
-
 
-@app.callback(
-    output=[Output('attendance_type', 'options'),
-            Output('attendance_type', 'value')],
-    inputs=[Input('faculty_selection', 'value'), Input('programme_selection', 'value')])
-def update_attendance_type(faculty, programme):
-    options = data[(data['faculty'] == faculty) & (
-        data['programme'] == programme)].attendancetype.unique().tolist()
-    value = options[0]
-    return options, value
-# Academic year
 
+def first(options):
+    return options[0] if options else None
 
-@app.callback(
-    output=[Output('academic_year', 'options'),
-            Output('academic_year', 'value')],
-    inputs=[Input('faculty_selection', 'value'), Input('programme_selection', 'value'), Input('attendance_type', 'value')])
-def update_attendance_type(faculty, programme, attendance_type):
-    options = data[(data['faculty'] == faculty) & (
-        data['programme'] == programme) & (data['attendancetype'] == attendance_type)].academicyear.unique().tolist()
-    value = options[0]
-    return options, value
-# semester
+# the whole filter cascade, programme -> attendance type -> academic year /
+# semester, resolved from the option tree in one round trip
 
 
 @app.callback(
-    output=[Output('semester', 'options'),
+    output=[Output('programme_selection', 'options'),
+            Output('programme_selection', 'value'),
+            Output('attendance_type', 'options'),
+            Output('attendance_type', 'value'),
+            Output('academic_year', 'options'),
+            Output('academic_year', 'value'),
+            Output('semester', 'options'),
             Output('semester', 'value')],
-    inputs=[Input('faculty_selection', 'value'), Input('programme_selection', 'value'), Input('attendance_type', 'value')])
-def update_attendance_type(faculty, programme, attendance_type):
-    options = data[(data['faculty'] == faculty) & (
-        data['programme'] == programme) & (data['attendancetype'] == attendance_type)].semester.unique().tolist()
-    value = options[0]
-    return options, value
+    inputs=[Input('faculty_selection', 'value'), Input('programme_selection', 'value'), Input('attendance_type', 'value'),
+            Input('pass_rate_heatmap', 'clickData')])
+def update_filters(faculty, programme, attendance_type, heatmap_click):
+    trigger_id = dash.callback_context.triggered_id
+    options = store.options
+
+    programmes = options.options(faculty)
+    # a heatmap cell drills through to its programme's charts
+    if trigger_id == 'pass_rate_heatmap' and heatmap_click:
+        programme, trigger_id = heatmap_click['points'][0]['y'], 'programme_selection'
+    # keep the selections below the dropdown that changed, reset the rest
+    if trigger_id not in ('programme_selection', 'attendance_type') or programme not in programmes:
+        programme = first(programmes)
+    attendance_types = options.options(faculty, programme)
+    if trigger_id != 'attendance_type' or attendance_type not in attendance_types:
+        attendance_type = first(attendance_types)
+    academic_years = options.options(faculty, programme, attendance_type)
+    semesters = options.semesters(faculty, programme, attendance_type)
+    return (programmes, programme, attendance_types, attendance_type,
+            academic_years, first(academic_years), semesters, first(semesters))
 # programme
 
 
 @app.callback(
     Output("graph", "figure"),
     Input("faculty_selection", "value"))
+@cached_figure
 def generate_chart(faculty):
-    data_grouped = data[(data['faculty'] == faculty) & (data['decision'] == "PASS")].groupby(by="grade")[
-        'regnum'].nunique()
-    data_grouped = data_grouped.reset_index(
-        name="Students")
-    fig = px.pie(data_grouped, values='Students', names='grade', hole=0.3,
-                 color_discrete_sequence=px.colors.sequential.RdBu,
-                 title=f"<b>Grade Distribution({data[(data['faculty']==faculty) & (data['decision'] == 'PASS')].regnum.nunique()})<b>"
-                 )
-    fig.update_layout(height=300, width=300, showlegend=False,
-                      template='simple_white')
+    with phase('filter'):
+        data_grouped = store.cube.counts((faculty,), 'grade', decision="PASS")
+        total = store.cube.total((faculty,), decision='PASS')
+    with phase('figure'):
+        fig = figures.donut(data_grouped.index, data_grouped, 'grade',
+                            f"<b>Grade Distribution({total})<b>",
+                            px.colors.sequential.RdBu)
     return fig
 
 
@@ -350,17 +437,15 @@ def decision_distribution(faculty):
 @app.callback(
     Output("gender_distribution", "figure"),
     Input("faculty_selection", "value"))
+@cached_figure
 def gender_distribution(faculty):
-    data_grouped = data[(data['faculty'] == faculty) & (data['decision'] == "PASS")].groupby(by="gender")[
-        'regnum'].nunique()
-    data_grouped = data_grouped.reset_index(
-        name="Students")
-    fig = px.pie(data_grouped, values='Students', names='gender',
-                 title=f"<b>Gender Distribution({data[(data['faculty']== faculty) & (data['decision']== 'PASS')].regnum.nunique()})<b>",
-                 hole=0.3,
-                 color_discrete_sequence=px.colors.sequential.YlOrRd_r)
-    fig.update_layout(height=300, width=300,
-                      showlegend=False, template='simple_white')
+    with phase('filter'):
+        data_grouped = store.cube.counts((faculty,), 'gender', decision="PASS")
+        total = store.cube.total((faculty,), decision='PASS')
+    with phase('figure'):
+        fig = figures.donut(data_grouped.index, data_grouped, 'gender',
+                            f"<b>Gender Distribution({total})<b>",
+                            px.colors.sequential.YlOrRd_r)
     return fig
 # programme decision distribution
 
@@ -394,24 +479,36 @@ def programme_decision_distribution(faculty, programme, attendance_type, academi
     [Input("faculty_selection", "value"),
      Input("programme_selection", "value")]
 )
+@cached_figure
 def module_pass_rate(faculty, programme):
-    df = data[(data['faculty'] == faculty) & (data['programme'] == programme)]
-    module_pass_rate = df.groupby(
-        'module')['mark'].apply(lambda x: (x >= 50).mean() * 100).sort_values(ascending=False)
-    module_pass_rate = module_pass_rate.reset_index(
-        name="Pass Rate")
-    fig = px.bar(
-        module_pass_rate[:20],
-        x="module",
-        y="Pass Rate",
-        # orientation='h',
-        title=f"<b> Pass Rates by Module<b>",
-        color_discrete_sequence=px.colors.sequential.YlGn_r,
-    )
+    with phase('filter'):
+        module_pass_rate = store.modules.programme(faculty, programme)[
+            'pass_rate'].sort_values(ascending=False)
+    with phase('figure'):
+        fig = figures.top_bar(module_pass_rate.index, module_pass_rate,
+                              "module", "Pass Rate", f"<b> Pass Rates by Module<b>",
+                              px.colors.sequential.YlGn_r[0], top=20,
+                              width=400, tickangle=45)
+    return fig
 
-    fig.update_layout(height=300, width=400,
-                      showlegend=False, template='simple_white')
-    fig.update_xaxes(tickangle=45)
+# pass rates of every module of every programme of a faculty, straight from
+# the matrices computed when the results load. clicking a cell selects its
+# programme
+
+
+@app.callback(
+    Output("pass_rate_heatmap", "figure"),
+    Input("faculty_selection", "value"))
+@cached_figure
+def pass_rate_heatmap(faculty):
+    with phase('filter'):
+        rates = store.modules.pass_rates(faculty)
+    with phase('figure'):
+        fig = figures.heatmap(rates.columns, rates.index, rates.to_numpy().round(1),
+                              "module", "programme", "Pass Rate",
+                              "<b>Module Pass Rates by Programme<b>",
+                              px.colors.sequential.YlGn, zmin=0, zmax=100,
+                              height=max(300, 150 + 25 * len(rates.index)))
     return fig
 
 # Attendance Type distribution
@@ -422,16 +519,14 @@ def module_pass_rate(faculty, programme):
     [Input("faculty_selection", "value"),
      Input("programme_selection", "value")]
 )
+@cached_figure
 def attendance_type_distribution(faculty, programme):
-    df = data[(data['faculty'] == faculty) & (data['programme'] == programme)]
-    data_grouped = df.groupby(by="attendancetype")[
-        'regnum'].nunique().reset_index(name="Students")
-    fig = px.pie(data_grouped, values='Students', names='attendancetype',
-                 color_discrete_sequence=px.colors.sequential.YlOrBr_r,
-                 hole=.3,
-                 title=f"<b>Attendance Type Distribution</b>")
-    fig.update_layout(height=300, width=300,
-                      showlegend=False, template='simple_white')
+    with phase('filter'):
+        data_grouped = store.cube.counts((faculty, programme), 'attendancetype')
+    with phase('figure'):
+        fig = figures.donut(data_grouped.index, data_grouped, 'attendancetype',
+                            f"<b>Attendance Type Distribution</b>",
+                            px.colors.sequential.YlOrBr_r)
     return fig
 # level distribution
 
@@ -441,16 +536,14 @@ def attendance_type_distribution(faculty, programme):
     [Input("faculty_selection", "value"),
      Input("programme_selection", "value")]
 )
+@cached_figure
 def academicyear_distribution(faculty, programme):
-    df = data[(data['faculty'] == faculty) & (data['programme'] == programme)]
-    data_grouped = df.groupby(by="academicyear")[
-        'regnum'].nunique().reset_index(name="Students")
-    fig = px.pie(data_grouped, values='Students', names='academicyear',
-                 hole=.3,
-                 color_discrete_sequence=px.colors.sequential.YlOrRd_r,
-                 title=f"<b>Academic Year Distribution</b>")
-    fig.update_layout(height=300, width=300,
-                      showlegend=False, template='simple_white')
+    with phase('filter'):
+        data_grouped = store.cube.counts((faculty, programme), 'academicyear')
+    with phase('figure'):
+        fig = figures.donut(data_grouped.index, data_grouped, 'academicyear',
+                            f"<b>Academic Year Distribution</b>",
+                            px.colors.sequential.YlOrRd_r)
     return fig
 # display decisions
 
@@ -507,6 +600,50 @@ def decision_list(faculty, programme, attendance_type, academic_year, semester):
 # drillthrough  callback
 
 
+def decision_table(key, decision, df):
+    # only the table shell is sent here, decision_table_page fills in the
+    # visible page
+    return [
+        html.H6(f"{decision}({(df['decision'] == decision).sum()})"),
+        html.Div([
+            dbc.Button([html.I(className='fa-solid fa-download me-2'), fmt.upper()],
+                       href=export.export_url(key, decision, fmt), external_link=True,
+                       size='sm', outline=True, className='me-2 mb-2')
+            for fmt in ('csv', 'xlsx')
+        ]),
+        dcc.Store(id='tbl_query', data={
+                  'key': list(key), 'decision': decision}),
+        dash_table.DataTable(
+            data=[],
+            columns=[{"name": i, "id": i}
+                     for i in df.columns[:-2]],
+            page_current=0,
+            page_size=5,
+            page_action='custom',
+            sort_action='custom',
+            sort_mode='multi',
+            sort_by=[],
+            filter_action='custom',
+            filter_query='',
+            row_selectable='single',
+            cell_selectable=True,
+            style_data_conditional=[
+                {
+                    "if": {"state": "active"},  # 'active' | 'selected'
+                    "backgroundColor": "rgba(0, 116, 217, 0.3)",
+                    "border": "1px solid rgb(0, 116, 217)",
+                },
+                {
+                    "if": {"state": "selected"},  # 'active' | 'selected'
+                    "backgroundColor": "rgba(0, 116, 217, 0.3)",
+                    "border": "1px solid rgb(0, 116, 217)",
+                }
+            ],
+            id='tbl'),
+        student_modal('modal', 'modal_body', 'close_modal'),
+    ]
+
+
 @app.callback(
     Output('decision_table', 'children'),  # to hide/unhide the back button
     [Input('programme_decision_distribution', 'clickData'),  # for getting the vendor name from graph
@@ -517,117 +654,115 @@ def decision_list(faculty, programme, attendance_type, academic_year, semester):
      Input("semester", "value")]
 )
 def drilldown(click_data, faculty, programme, attendancetype, academicyear, semester):
-    df = data[(data['faculty'] == faculty) & (data['programme'] == programme) & (data['attendancetype']
-                                                                                 == attendancetype) & (data['academicyear'] == academicyear) & (data['semester'] == semester)]
-    df = df.drop_duplicates(['regnum'], keep='last')
-    df.drop(['mark', 'grade', 'faculty', 'programme', 'programmetype',
-            'attendancetype', 'module', 'programmestatus'], axis=1, inplace=True)
-    df['id'] = df.regnum
-    decisions = df.decision.unique().tolist()
+    key = (faculty, programme, attendancetype, academicyear, semester)
     # using callback context to check which input was fired
     ctx = dash.callback_context
     trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    children = []
 
     if trigger_id == 'programme_decision_distribution':
-        # get vendor name from clickData
-        if click_data is not None:
-            decision = click_data['points'][0]['label']
+        with phase('filter'):
+            df = store.roster(*key)
+            decisions = df.decision.unique().tolist()
+        # get vendor name from clickData, falling back to the first decision
+        decision = click_data['points'][0]['label'] if click_data is not None else None
+        if decision not in decisions:
+            decision = first(decisions)
+        if decision is None:
+            return []
+        return decision_table(key, decision, df)
 
-            if decision in df.decision.unique():
-                children.append(html.H6(
-                    f"{decision}({df[df['decision']==decision].regnum.nunique()})"))
-                children.append(dash_table.DataTable(
-                    df[df['decision'] == decision].to_dict('records'),
-                    page_size=5,
-                    columns=[{"name": i, "id": i}
-                             for i in df.columns[:-2]],
-                    row_selectable='single',
-                    cell_selectable=True,
-                    style_data_conditional=[
-                        {
-                            "if": {
-                                "state": "active"  # 'active' | 'selected'
-                            },
-                            "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                            "border": "1px solid rgb(0, 116, 217)",
-                        },
-                        {
-                            "if": {
-                                "state": "selected"  # 'active' | 'selected'
-                            },
-                            "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                            "border": "1px solid rgb(0, 116, 217)",
-                        }
+# server side paging, sorting and filtering of the decision table
 
-                    ],
-                    id='tbl'))
-                children.append(dbc.Modal(
-                    [
-                        dbc.ModalHeader("Selected Row"),
-                        dbc.ModalBody(id="modal_body"),
-                        dbc.ModalFooter(
-                            dbc.Button("Close", id="close_modal",
-                                       className="ml-auto", n_clicks=0, size='sm')
-                        ),
-                    ],
-                    id="modal",
-                    size="lg",
-                ))
 
-                # returning the fig and unhiding the back button
-                return children
-            else:
-                children.append(html.H6(
-                    f"{decision}({df[df['decision']==decisions[0]].regnum.nunique()})"))
-                children.append(dash_table.DataTable(
-                    df[df['decision'] == decisions[0]].to_dict('records'),
-                    page_size=5,
-                    columns=[{"name": i, "id": i}
-                             for i in df.columns[:-2]],
-                    row_selectable='single',
-                    cell_selectable=True,
-                    style_data_conditional=[
-                        {
-                            "if": {
-                                "state": "active"  # 'active' | 'selected'
-                            },
-                            "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                            "border": "1px solid rgb(0, 116, 217)",
-                        },
-                        {
-                            "if": {
-                                "state": "selected"  # 'active' | 'selected'
-                            },
-                            "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                            "border": "1px solid rgb(0, 116, 217)",
-                        }
+@app.callback(
+    Output('tbl', 'data'),
+    Output('tbl', 'page_count'),
+    Input('tbl', 'page_current'),
+    Input('tbl', 'page_size'),
+    Input('tbl', 'sort_by'),
+    Input('tbl', 'filter_query'),
+    State('tbl_query', 'data'),
+)
+def decision_table_page(page_current, page_size, sort_by, filter_query, query):
+    key, decision = tuple(query['key']), query['decision']
+    order = tuple((col['column_id'], col['direction']) for col in sort_by or [])
 
-                    ],
-                    id=f'tbl'))
-                children.append(dbc.Modal(
-                    [
-                        dbc.ModalHeader("Student Information"),
-                        dbc.ModalBody(id="modal_body"),
-                        dbc.ModalFooter(
-                            dbc.Button("Close", id="close_modal",
-                                       className="ml-auto", n_clicks=0)
-                        ),
-                    ],
-                    id="modal",
-                    size="lg",
-                ))
-                return children
-        else:
-            children.append(html.H6(
-                f"{decision}({df[df['decision']==decisions[0]].regnum.nunique()})"))
-            children.append(dash_table.DataTable(
-                df[df['decision'] == decisions[0]].to_dict('records'),
-                page_size=5,
+    def compute():
+        df = store.roster(*key)
+        df = df[df['decision'] == decision]
+        return sort_frame(filter_frame(df, filter_query), sort_by)
+    # paging through the same selection reuses the filtered, sorted rows
+    with phase('filter'):
+        df = store.subset('decision_table', (key, decision, filter_query, order), compute)
+    return page_frame(df, page_current, page_size).to_dict('records'), page_count(df, page_size)
+
+# open modal callback, row selection runs in the browser (assets/clientside.js)
+
+
+app.clientside_callback(
+    ClientsideFunction('results', 'select_active_row'),
+    Output('tbl', 'selected_rows'),
+    Input('tbl', 'active_cell'),
+    prevent_initial_call=True
+)
+
+
+# student details, built on the first click and then served from the cache
+
+
+@cached_student
+def student_modal_body(regnum):
+    with phase('filter'):
+        student_info = store.students.rows(regnum)
+    modules = student_info.drop(["programmetype", 'attendancetype', "academicyear", "semester", "decision",
+                                 "firstnames", "surname", "faculty", "programme", "programmecode", "programmestatus"], axis=1)
+    modal_body = dbc.Container([
+        dbc.Row([
+            dbc.Col(html.P("Registration Number"),),
+            dbc.Col(html.P(student_info['regnum'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("First Name"),),
+            dbc.Col(html.P(student_info['firstnames'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Surname"),),
+            dbc.Col(html.P(student_info['surname'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Programme"),),
+            dbc.Col(html.P(student_info['programmecode'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Decision"),),
+            dbc.Col(html.P(student_info['decision'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Attendance Type"),),
+            dbc.Col(html.P(student_info['attendancetype'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Semester"),),
+            dbc.Col(html.P(student_info['semester'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Academic Year"),),
+            dbc.Col(html.P(student_info['academicyear'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Programme Type"),),
+            dbc.Col(html.P(student_info['programmetype'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Col(html.P("Programme Status"),),
+            dbc.Col(html.P(student_info['programmestatus'].iloc[0]))
+        ]),
+        dbc.Row([
+            dbc.Label('Modules'),
+            dash_table.DataTable(
+                modules.to_dict('records'),
                 columns=[{"name": i, "id": i}
-                         for i in df.columns[:-2]],
-                row_selectable='single',
-                cell_selectable=True,
+                         for i in modules.columns[:-2]],
                 style_data_conditional=[
                     {
                         "if": {"state": "active"},  # 'active' | 'selected'
@@ -635,185 +770,149 @@ def drilldown(click_data, faculty, programme, attendancetype, academicyear, seme
                         "border": "1px solid rgb(0, 116, 217)",
                     },
                     {
-                        "if": {"state": "selected"},  # 'active' | 'selected'
+                        # 'active' | 'selected'
+                        "if": {"state": "selected"},
                         "backgroundColor": "rgba(0, 116, 217, 0.3)",
                         "border": "1px solid rgb(0, 116, 217)",
                     }
                 ],
-                id='tbl'))
-            children.append(dbc.Modal(
-                [
-                    dbc.ModalHeader("Selected Row"),
-                    dbc.ModalBody(id="modal_body"),
-                    dbc.ModalFooter(
-                            dbc.Button("Close", id="close_modal",
-                                       className="ml-auto", n_clicks=0)
-                            ),
-                ],
-                id="modal",
-                size="lg",
-            ))
-            return children
+                id='data_tbl'
+            ),
+        ]),
 
-# open modal callback
 
 
-@app.callback(
-    (
-        Output('tbl', 'selected_rows'),
-    ),
-    Input('tbl', 'active_cell'),
+    ])
+    return modal_body
+
+
+app.clientside_callback(
+    ClientsideFunction('results', 'table_selection'),
+    Output('tbl', 'style_data_conditional'),
+    Output('tbl', 'active_cell'),
+    Output('tbl', 'selected_cells'),
+    Output('modal', 'is_open'),
+    Input('tbl', 'derived_viewport_selected_row_ids'),
+    Input('close_modal', 'n_clicks'),
+    State('tbl', 'derived_viewport_selected_rows'),
+    State('tbl', 'active_cell'),
+    State('tbl', 'selected_cells'),
+    State('modal', 'is_open'),
     prevent_initial_call=True
 )
-def update_graphs(active_cell):
-    return (
-        [active_cell['row']],
-    ) if active_cell else ([],)
 
 
+# the modal opens in the browser, only the student details come from here
 @app.callback(
-    (
-        Output('tbl', 'style_data_conditional'),
-        Output('tbl', 'active_cell'),
-        Output('tbl', 'selected_cells'),
-        Output('modal', 'is_open'),
-        Output('modal_body', 'children')
-    ),
-    [
-        Input('tbl', 'derived_viewport_selected_row_ids'),
-        Input('close_modal', 'n_clicks')
-    ],
-    [
-        State('tbl', 'derived_viewport_selected_rows'),
-        State('tbl', 'active_cell'),
-        State('tbl', 'selected_cells'),
-        State('modal', 'is_open')
-    ],
+    Output('modal_body', 'children'),
+    Input('tbl', 'derived_viewport_selected_row_ids'),
     prevent_initial_call=True
 )
-def update_graphs2(selected_row_ids, close_modal_clicks, selected_rows, active_cell, selected_cells, is_modal_open):
-    if selected_row_ids:
-        if active_cell:
-            active_cell['row'] = selected_rows[0]
-        else:
-            active_cell = no_update
-
-        student_info = data[data['regnum'] == selected_row_ids[0]]
-        modal_body = dbc.Container([
-            dbc.Row([
-                dbc.Col(html.P("Registration Number"),),
-                dbc.Col(html.P(student_info['regnum'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("First Name"),),
-                dbc.Col(html.P(student_info['firstnames'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Surname"),),
-                dbc.Col(html.P(student_info['surname'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Programme"),),
-                dbc.Col(html.P(student_info['programmecode'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Decision"),),
-                dbc.Col(html.P(student_info['decision'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Attendance Type"),),
-                dbc.Col(html.P(student_info['attendancetype'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Semester"),),
-                dbc.Col(html.P(student_info['semester'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Academic Year"),),
-                dbc.Col(html.P(student_info['academicyear'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Programme Type"),),
-                dbc.Col(html.P(student_info['programmetype'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Col(html.P("Programme Status"),),
-                dbc.Col(html.P(student_info['programmestatus'].iloc[0]))
-            ]),
-            dbc.Row([
-                dbc.Label('Modules'),
-                dash_table.DataTable(
-                    student_info.drop(["programmetype", 'attendancetype', "academicyear", "semester", "decision",
-                                      "firstnames", "surname", "faculty", "programme", "programmecode", "programmestatus"], axis=1).to_dict('records'),
-                    columns=[{"name": i, "id": i}
-                             for i in student_info.drop(["programmetype", 'attendancetype', "academicyear", "semester", "decision",
-                                                         "firstnames", "surname", "faculty", "programme", "programmecode", "programmestatus"], axis=1).columns[:-2]],
-                    style_data_conditional=[
-                        {
-                            "if": {"state": "active"},  # 'active' | 'selected'
-                            "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                            "border": "1px solid rgb(0, 116, 217)",
-                        },
-                        {
-                            # 'active' | 'selected'
-                            "if": {"state": "selected"},
-                            "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                            "border": "1px solid rgb(0, 116, 217)",
-                        }
-                    ],
-                    id='data_tbl'
-                ),
-            ]),
+def update_graphs2(selected_row_ids):
+    if not selected_row_ids:
+        return no_update
+    return student_modal_body(selected_row_ids[0])
 
+# student search. every keystroke is answered from the store's prefix index
+# and picking a student opens their details in the search modal
 
 
-        ])
+@app.callback(
+    Output('student_search', 'options'),
+    Input('student_search', 'search_value'),
+    prevent_initial_call=True
+)
+def student_search_options(search_value):
+    # an empty search keeps the options, so the picked student stays shown
+    if not search_value:
+        return no_update
+    with phase('filter'):
+        matches = store.search.search(search_value)
+    return [{'label': label, 'value': regnum} for regnum, label in matches]
+
+
+app.clientside_callback(
+    ClientsideFunction('results', 'search_modal'),
+    Output('search_modal', 'is_open'),
+    Input('student_search', 'value'),
+    Input('close_search_modal', 'n_clicks'),
+    prevent_initial_call=True
+)
 
-        # html.P(f"Selected Row ID: {selected_row_ids}")
-        is_modal_open = True
 
-        return (
-            [
-                {
-                    "if": {"filter_query": "{{id}} = '{}'".format(i)},
-                    "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                    "border": "1px solid rgb(0, 116, 217)",
-                } for i in selected_row_ids
-            ] + [
-                {
-                    "if": {"state": "active"},  # 'active' | 'selected'
-                    "backgroundColor": "rgba(0, 116, 217, 0.3)",
-                    "border": "1px solid rgb(0, 116, 217)",
-                }
-            ],
-            active_cell,
-            [],
-            is_modal_open,
-            modal_body
-        )
-    elif close_modal_clicks:
-        is_modal_open = False
-        return ([], no_update, [], is_modal_open, no_update)
-    else:
-        return ([], no_update, [], is_modal_open, no_update)
+@app.callback(
+    Output('search_modal_body', 'children'),
+    Input('student_search', 'value'),
+    prevent_initial_call=True
+)
+def search_modal_body(regnum):
+    if not regnum:
+        return no_update
+    return student_modal_body(regnum)
 
 # Faculty decision drill through
 
 
+def decision_pie_update(counts, title):
+    # a filter change while a decision pie is on screen only sends the new
+    # labels, values and title, the rest of the figure stays in the browser.
+    # only used once the browser flagged the pie as rendered: before the
+    # first full figure there is nothing to patch
+    patch = Patch()
+    patch['data'][0]['labels'] = counts.index.tolist()
+    patch['data'][0]['values'] = counts.tolist()
+    patch['layout']['title']['text'] = title
+    return patch
+
+
+def faculty_decision_title(faculty):
+    return f"<b>Decision Distribution({store.cube.total((faculty,))})<b>"
+
+
+def faculty_decision_update(faculty):
+    with phase('filter'):
+        return decision_pie_update(store.cube.counts((faculty,), 'decision'),
+                                   faculty_decision_title(faculty))
+
+
+@cached_figure
+def faculty_decision_figure(faculty):
+    with phase('filter'):
+        data_grouped = store.cube.counts((faculty,), 'decision')
+        title = faculty_decision_title(faculty)
+    with phase('figure'):
+        fig = figures.donut(data_grouped.index, data_grouped, 'decision', title,
+                            px.colors.sequential.YlOrRd_r)
+    return fig
+
+
+@cached_figure
+def faculty_decision_drill_figure(faculty, decision):
+    with phase('filter'):
+        grouped_data = store.cube.counts((faculty,), 'programmecode', decision).sort_values(
+            ascending=False)
+
+    # generating product sales bar graph
+    with phase('figure'):
+        fig = figures.category_bar(grouped_data.index, grouped_data, 'programmecode',
+                                   'Students', f'<b>Student Distribution({decision})<b>',
+                                   top=10, tickangle=45)
+    return fig
+
+
 @app.callback(
     Output('decision_distribution', 'figure'),
-    Output('back-button', 'style'),  # to hide/unhide the back button
     # for getting the vendor name from graph
     Input('decision_distribution', 'clickData'),
     Input('back-button', 'n_clicks'),
-    Input('faculty_selection', 'value')
+    Input('faculty_selection', 'value'),
+    State('decision_pie_shown', 'data')
 )
-def decision_drilldown(click_data, n_clicks, faculty):
+def decision_drilldown(click_data, n_clicks, faculty, pie_shown):
 
     # using callback context to check which input was fired
     ctx = dash.callback_context
     trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    df = data[data['faculty'] == faculty]
 
     if trigger_id == 'decision_distribution':
 
@@ -821,54 +920,80 @@ def decision_drilldown(click_data, n_clicks, faculty):
         if click_data is not None:
             decision = click_data['points'][0]['label']
 
-            if decision in df.decision.unique():
-                # creating df for clicked vendor
-
-                grouped_data = df[df['decision'] == decision].groupby(
-                    by='programmecode')['regnum'].nunique().sort_values(ascending=False).reset_index(name="Students")
-
-                # generating product sales bar graph
-                fig = px.bar(grouped_data[:10], x='programmecode',
-                             y='Students', color='programmecode')
-                fig.update_layout(title=f'<b>Student Distribution({decision})<b>',
-                                  height=300, width=300,
-                                  showlegend=False, template='simple_white')
-                fig.update_xaxes(tickangle=45)
-                # returning the fig and unhiding the back button
-                return fig, {'display': 'block'}
+            if decision in store.cube.counts((faculty,), 'decision'):
+                # returning the drilled down fig
+                return faculty_decision_drill_figure(faculty, decision)
 
             else:
-                data_grouped = data[(data['faculty'] == faculty)].groupby(by="decision")[
-                    'regnum'].nunique()
-                data_grouped = data_grouped.reset_index(
-                    name="Students")
-                fig = px.pie(data_grouped, values='Students', names='decision',
-                             title=f"<b>Decision Distribution({data[data['faculty']== faculty].regnum.nunique()})<b>",
-                             hole=0.3,
-                             color_discrete_sequence=px.colors.sequential.YlOrRd_r)
-                fig.update_layout(height=300, width=300,
-                                  showlegend=False, template='simple_white')
-                return fig, {'display': 'none'}  # hiding the back button
+                return faculty_decision_figure(faculty)
+
+    elif trigger_id == 'faculty_selection' and pie_shown:
+        return faculty_decision_update(faculty)
 
     else:
-        data_grouped = data[(data['faculty'] == faculty)].groupby(by="decision")[
-            'regnum'].nunique()
-        data_grouped = data_grouped.reset_index(
-            name="Students")
-        fig = px.pie(data_grouped, values='Students', names='decision',
-                     title=f"<b>Decision Distribution({data[(data['faculty']== faculty) & data['decision'] != 'PASS'].regnum.nunique()})<b>",
-                     hole=0.3,
-                     color_discrete_sequence=px.colors.sequential.YlOrRd_r)
-        fig.update_layout(height=300, width=300,
-                          showlegend=False, template='simple_white')
-        return fig, {'display': 'none'}
+        return faculty_decision_figure(faculty)
+
+
+# hide/unhide the back button in the browser, following the figure
+app.clientside_callback(
+    ClientsideFunction('results', 'back_button_style'),
+    Output('back-button', 'style'),
+    Input('decision_distribution', 'figure')
+)
+
+# flag a rendered decision pie, the figure a filter change may patch
+app.clientside_callback(
+    ClientsideFunction('results', 'pie_shown'),
+    Output('decision_pie_shown', 'data'),
+    Input('decision_distribution', 'figure')
+)
 
 # programme decision distribution
 
 
+# the dropdowns a programme decision pie follows
+FILTERS = ('faculty_selection', 'programme_selection', 'attendance_type',
+           'academic_year', 'semester')
+
+
+def programme_decision_title(*key):
+    return f"<b>Decision Distribution {store.cube.total(key)}</b>"
+
+
+def programme_decision_update(*key):
+    with phase('filter'):
+        return decision_pie_update(store.cube.counts(key, 'decision'),
+                                   programme_decision_title(*key))
+
+
+@cached_figure
+def programme_decision_figure(faculty, programme, attendancetype, academicyear, semester):
+    key = (faculty, programme, attendancetype, academicyear, semester)
+    with phase('filter'):
+        data_grouped = store.cube.counts(key, 'decision')
+        title = programme_decision_title(*key)
+    with phase('figure'):
+        fig = figures.donut(data_grouped.index, data_grouped, 'decision', title,
+                            px.colors.sequential.RdBu)
+    return fig
+
+
+@cached_figure
+def programme_decision_drill_figure(faculty, programme, attendancetype, academicyear, semester, decision):
+    key = (faculty, programme, attendancetype, academicyear, semester)
+    with phase('filter'):
+        grouped_data = store.cube.counts(key, 'module', decision).sort_values(
+            ascending=False)
+
+    # generating product sales bar graph
+    with phase('figure'):
+        fig = figures.category_bar(grouped_data.index, grouped_data, 'module',
+                                   'Students', f'<b>Students distribution({decision})<b>')
+    return fig
+
+
 @app.callback(
     Output('programme_decision_distribution', 'figure'),
-    Output('back-btn', 'style'),  # to hide/unhide the back button
     [Input('programme_decision_distribution', 'clickData'),  # for getting the vendor name from graph
      Input('back-btn', 'n_clicks'),
      Input('faculty_selection', 'value'),
@@ -876,11 +1001,11 @@ def decision_drilldown(click_data, n_clicks, faculty):
      Input('attendance_type', 'value'),
      Input('academic_year', 'value'),
      Input('semester', 'value')
-     ]
+     ],
+    State('programme_decision_pie_shown', 'data')
 )
-def programme_decision_drilldown(click_data, n_clicks, faculty, programme, attendancetype, academicyear, semester):
-    df = data[(data['faculty'] == faculty) & (data['programme'] == programme) & (data['attendancetype']
-                                                                                 == attendancetype) & (data['academicyear'] == academicyear) & (data['semester'] == semester)]
+def programme_decision_drilldown(click_data, n_clicks, faculty, programme, attendancetype, academicyear, semester, pie_shown):
+    key = (faculty, programme, attendancetype, academicyear, semester)
 
     # using callback context to check which input was fired
     ctx = dash.callback_context
@@ -892,41 +1017,86 @@ def programme_decision_drilldown(click_data, n_clicks, faculty, programme, atten
         if click_data is not None:
             decision = click_data['points'][0]['label']
 
-            if decision in df.decision.unique():
-                # creating df for clicked vendor
-                grouped_data = df[df['decision'] == decision].groupby(
-                    by='module')['regnum'].nunique().sort_values(ascending=False).reset_index(name="Students")
-
-                # generating product sales bar graph
-                fig = px.bar(grouped_data, x='module',
-                             y='Students', color='module')
-                fig.update_layout(title=f'<b>Students distribution({decision})<b>',
-                                  showlegend=False, template='simple_white', width=300, height=300)
-                # returning the fig and unhiding the back button
-                return fig, {'display': 'block'}
+            if decision in store.cube.counts(key, 'decision'):
+                # returning the drilled down fig
+                return programme_decision_drill_figure(*key, decision)
 
             else:
-                data_grouped = df.groupby(by="decision")[
-                    'regnum'].nunique().reset_index(name="Students")
-                fig = px.pie(data_grouped, values='Students', names='decision',
-                             hole=0.3,
-                             color_discrete_sequence=px.colors.sequential.RdBu,
-                             title=f"<b>Decision Distribution {df.regnum.nunique()}</b>")
-                fig.update_layout(height=300, width=300, showlegend=False,
-                                  template='simple_white')
-                return fig, {'display': 'none'}  # hiding the back button
+                return programme_decision_figure(*key)
+
+    elif trigger_id in FILTERS and pie_shown:
+        return programme_decision_update(*key)
 
     else:
-        data_grouped = df.groupby(by="decision")[
-            'regnum'].nunique().reset_index(name="Students")
-        fig = px.pie(data_grouped, values='Students', names='decision',
-                     hole=0.3,
-                     color_discrete_sequence=px.colors.sequential.RdBu,
-                     title=f"<b>Decision Distribution {df.regnum.nunique()}</b>")
-        fig.update_layout(height=300, width=300, showlegend=False,
-                          template='simple_white')
-        return fig, {'display': 'none'}
+        return programme_decision_figure(*key)
+
+
+app.clientside_callback(
+    ClientsideFunction('results', 'back_button_style'),
+    Output('back-btn', 'style'),
+    Input('programme_decision_distribution', 'figure')
+)
+
+app.clientside_callback(
+    ClientsideFunction('results', 'pie_shown'),
+    Output('programme_decision_pie_shown', 'data'),
+    Input('programme_decision_distribution', 'figure')
+)
 
+# cache warm-up: the charts of every faculty, then every programme, then
+# every filter selection are built into the figure cache at startup and
+# again whenever the results change, in a background thread. that is about
+# 7500 figures, 45 MB and 2-3 s for a million results. with
+# SERVE_BEFORE_WARMUP the server answers requests meanwhile, otherwise
+# importing this module waits for the warm-up
+WARMUP = True
+SERVE_BEFORE_WARMUP = True
+
+
+def warm_faculty(faculty):
+    generate_chart(faculty)
+    pass_rate_heatmap(faculty)
+    gender_distribution(faculty)
+    faculty_decision_figure(faculty)
+    for decision in store.cube.counts((faculty,), 'decision').index:
+        faculty_decision_drill_figure(faculty, decision)
+
+
+def warm_programme(faculty, programme):
+    module_pass_rate(faculty, programme)
+    attendance_type_distribution(faculty, programme)
+    academicyear_distribution(faculty, programme)
+
+
+def warm_selection(*key):
+    programme_decision_figure(*key)
+    for decision in store.cube.counts(key, 'decision').index:
+        programme_decision_drill_figure(*key, decision)
+
+
+def warmup_tasks():
+    # level by level, so the views most users open are warmed first
+    if not WARMUP:
+        return []
+    tasks = []
+    keys = [()]
+    for length in range(1, 6):
+        keys = [(*key, value) for key in keys for value in store.options.options(*key)]
+        if length == 1:
+            tasks.extend((warm_faculty, key) for key in keys)
+        elif length == 2:
+            tasks.extend((warm_programme, key) for key in keys)
+    tasks.extend((warm_selection, key) for key in keys)
+    return tasks
+
+
+warmup = CacheWarmer([figure_cache], warmup_tasks)
+# the figure cache is cleared first, then warmed from the new results
+store.listeners.append(lambda store: warmup.start())
+if SERVE_BEFORE_WARMUP:
+    warmup.start()
+else:
+    warmup.run()
 
 if __name__ == "__main__":
     app.run_server(debug=True)
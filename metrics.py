@@ -0,0 +1,157 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+
+# upper bounds of the histogram buckets
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BYTES_BUCKETS = [1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10,
+                 1 << 20, 4 << 20, 16 << 20]
+# inputs logged with a slow callback are cut off after this many characters
+SLOW_LOG_INPUTS = 2000
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    # cumulative bucket counts, sum and count of observed values
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        total = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            total += count
+            yield f"{name}_bucket{_labels(labels + (('le', bound),))} {total}"
+        yield f"{name}_sum{_labels(labels)} {self.sum}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}' if pairs else ''
+
+
+# name -> (help, buckets) of the recorded histograms
+HISTOGRAMS = {
+    'dash_callback_seconds': (
+        "wall time of a callback request, serialisation included", SECONDS_BUCKETS),
+    'dash_callback_phase_seconds': (
+        "time a callback spent filtering, building figures, in the rest of "
+        "the callback and serialising the response", SECONDS_BUCKETS),
+    'dash_callback_payload_bytes': (
+        "size of the callback response", BYTES_BUCKETS),
+}
+
+
+class CallbackMetrics:
+    # latency, phase and payload histograms of the dash callbacks, served in
+    # the prometheus text format. callbacks mark their filtering and figure
+    # building with phase(), the remaining callback time is 'other' and
+    # everything after the callback returned is 'serialize'
+
+    def __init__(self, slow_seconds=None):
+        self.slow_seconds = slow_seconds
+        self.histograms = defaultdict(dict)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, name, labels, value):
+        labels = tuple(labels.items())
+        with self._lock:
+            histogram = self.histograms[name].get(labels)
+            if histogram is None:
+                histogram = self.histograms[name][labels] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    @contextmanager
+    def phase(self, name):
+        phases = getattr(self._local, 'phases', None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if phases is not None:
+                phases[name] += time.perf_counter() - start
+
+    def wrap(self, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            self._local.phases = phases = defaultdict(float)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.phases = None
+                if flask.has_request_context():
+                    flask.g.metrics_callback = func.__name__
+                    flask.g.metrics_seconds = time.perf_counter() - start
+                    flask.g.metrics_phases = phases
+        return timed
+
+    def instrument(self, app):
+        # time every callback registered through app.callback from now on
+        # and serve the histograms at /metrics
+        register = app.callback
+
+        def callback(*args, **kwargs):
+            decorator = register(*args, **kwargs)
+            return lambda func: decorator(self.wrap(func))
+        app.callback = callback
+        app.server.before_request(self._started)
+        app.server.after_request(self._finished)
+        app.server.add_url_rule('/metrics', 'metrics', self.response)
+
+    def _started(self):
+        flask.g.metrics_start = time.perf_counter()
+
+    def _finished(self, response):
+        name = flask.g.pop('metrics_callback', None)
+        if name is None:
+            return response
+        total = time.perf_counter() - flask.g.metrics_start
+        phases = dict(flask.g.metrics_phases)
+        phases['other'] = max(flask.g.metrics_seconds - sum(phases.values()), 0)
+        phases['serialize'] = max(total - flask.g.metrics_seconds, 0)
+        labels = {'callback': name}
+        self.observe('dash_callback_seconds', labels, total)
+        for phase, seconds in phases.items():
+            self.observe('dash_callback_phase_seconds', dict(labels, phase=phase), seconds)
+        if not response.is_streamed:
+            self.observe('dash_callback_payload_bytes', labels,
+                         len(response.get_data()))
+        if self.slow_seconds is not None and total >= self.slow_seconds:
+            body = flask.request.get_json(silent=True) or {}
+            inputs = json.dumps({key: body.get(key) for key in ('inputs', 'state')},
+                                default=str)
+            logger.warning("slow callback %s took %.3fs (%s) inputs %s", name, total,
+                           ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in phases.items()),
+                           inputs[:SLOW_LOG_INPUTS])
+        return response
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    lines.extend(histogram.lines(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return flask.Response(self.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,527 @@
+import copy
+import logging
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CUBE, ModuleStats, StudentCube, distinct_students
+from cache import LRUCache, TTLCache
+from dataset import (DATA_PATH, LEVELS, SNAPSHOT_DIR, HierarchicalIndex,
+                     OptionTree, StudentIndex, csv_signature, map_feather,
+                     merge_batch, publish_once, read_csv, write_feather)
+from search import StudentSearch, student_names
+from store import SUBSET_CACHE_SIZE, SUBSET_TTL, BaseStore
+
+# the results are stored as one columnar file per academic year and
+# semester, the last two filter levels, so a selection down to a semester
+# reads a single partition
+PARTITION_LEVELS = ['academicyear', 'semester']
+# cube cells this many levels deep or less span partitions. they are
+# counted when the partitions are built and kept with them
+SHARED_DEPTH = len(LEVELS) - len(PARTITION_LEVELS)
+SHARED_CUBE = {spec: tuple(depth for depth in depths if depth <= SHARED_DEPTH)
+               for spec, depths in CUBE.items()}
+SHARED_CUBE = {spec: depths for spec, depths in SHARED_CUBE.items() if depths}
+# partitions held in memory, the least recently used are dropped
+PARTITION_CACHE_SIZE = 8
+# counts computed from partitions, kept until the results change
+QUERY_CACHE_SIZE = 1024
+# students per page of the partitions they have rows in. an ingest copies
+# the pages of the students in its batch, the rest stay shared
+STUDENT_PAGE = 4096
+# an ingest writes the partitions it changes under new names, the files
+# they replace are deleted this many seconds later by a later ingest. other
+# workers reload within a poll of the drop directory, well before
+PARTITION_RETIRE_SECONDS = 600
+# version of the partition and catalog layout, see csv_signature
+PARTITIONS_VERSION = 6
+
+logger = logging.getLogger(__name__)
+
+
+def partitions_path(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(snapshot_dir, f"{name}.partitions")
+
+
+def _file_name(number, generation):
+    return f"part-{number}.{generation}.feather"
+
+
+def _split(data):
+    # the rows of every (academicyear, semester) in frame order, missing
+    # values as None
+    codes = [data[level].cat.codes.to_numpy().astype('int64') + 1 for level in PARTITION_LEVELS]
+    sizes = [len(data[level].cat.categories) + 1 for level in PARTITION_LEVELS]
+    combined = np.ravel_multi_index(codes, sizes)
+    order = np.argsort(combined, kind='stable')
+    starts = np.flatnonzero(np.r_[True, combined[order][1:] != combined[order][:-1]])
+    stops = np.r_[starts[1:], len(order)]
+    categories = [data[level].cat.categories for level in PARTITION_LEVELS]
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        first = order[start]
+        part = tuple(values[code[first] - 1] if code[first] else None
+                     for values, code in zip(categories, codes))
+        yield part, data.iloc[order[start:stop]]
+
+
+def _conform(data, categories):
+    # partitions written before an ingest lack the categories it added,
+    # which always come after the ones they have
+    for column, values in categories.items():
+        if len(data[column].cat.categories) != len(values):
+            data = data.copy(deep=False)
+            data[column] = data[column].cat.set_categories(values)
+    return data
+
+
+class StudentParts:
+    # the partitions every student has rows in, as bits numbered like the
+    # partitions in rows indexed by regnum code. the rows are split in pages
+    # and a copy shares them until it writes to one
+
+    def __init__(self):
+        self.pages = []
+        self.width = 1
+        self.owned = set()
+
+    def copy(self):
+        parts = copy.copy(self)
+        parts.pages, parts.owned = list(self.pages), set()
+        return parts
+
+    def _pages(self, codes):
+        # (page, rows in it) of regnum codes
+        codes = np.unique(codes[codes >= 0])
+        pages = codes // STUDENT_PAGE
+        for page in np.unique(pages).tolist():
+            yield page, codes[pages == page] % STUDENT_PAGE
+
+    def _writable(self, page):
+        while len(self.pages) <= page:
+            self.owned.add(len(self.pages))
+            self.pages.append(np.zeros((STUDENT_PAGE, self.width), dtype=np.uint8))
+        if page not in self.owned:
+            self.pages[page] = self.pages[page].copy()
+            self.owned.add(page)
+        return self.pages[page]
+
+    def numbers(self, codes):
+        # the partition numbers any of the students has rows in
+        bits = np.zeros(self.width, dtype=np.uint8)
+        for page, rows in self._pages(codes):
+            if page < len(self.pages):
+                bits |= np.bitwise_or.reduce(self.pages[page][rows], axis=0)
+        return np.flatnonzero(np.unpackbits(bits, bitorder='little')).tolist()
+
+    def add(self, codes, number):
+        if number >= self.width * 8:
+            self.width = number // 8 + 1
+            self.pages = [np.pad(page, ((0, 0), (0, self.width - page.shape[1])))
+                          for page in self.pages]
+            self.owned = set(range(len(self.pages)))
+        for page, rows in self._pages(codes):
+            self._writable(page)[rows, number // 8] |= np.uint8(1 << number % 8)
+
+    def discard(self, codes, number):
+        if number >= self.width * 8:
+            return
+        for page, rows in self._pages(codes):
+            if page < len(self.pages):
+                self._writable(page)[rows, number // 8] &= np.uint8(~(1 << number % 8) & 0xff)
+
+
+class Catalog:
+    # what the store knows without reading a partition: the partition files
+    # with the faculties in them, the partitions every student has rows in,
+    # the categories of the results, the dropdown keys, the student search
+    # and the aggregates spanning partitions. every ingest makes a new
+    # generation and the files it replaced are kept as retired until no
+    # worker can still be reading them
+
+    def __init__(self, data, signature):
+        self.signature = signature
+        self.generation = 0
+        self.files = {}
+        # file name -> time it was replaced
+        self.retired = {}
+        self.faculties = {}
+        self.students = StudentParts()
+        self.categories = {column: data[column].cat.categories for column in data
+                           if data[column].dtype == 'category'}
+        self.empty = data.iloc[0:0]
+        self.keys = [key for key in HierarchicalIndex(data).bounds if len(key) == len(LEVELS)]
+        self.cube = StudentCube(data, SHARED_CUBE)
+        self.modules = ModuleStats(data)
+        self.search = StudentSearch(student_names(data))
+        self.rank_levels()
+
+    def rank_levels(self):
+        # frame order of the level values, the frame is sorted on their codes
+        self.ranks = {level: {value: rank for rank, value in
+                              enumerate(self.categories[level].tolist())}
+                      for level in LEVELS}
+
+    def level_rank(self, key):
+        return [self.ranks[level].get(value, sys.maxsize) for level, value in zip(LEVELS, key)]
+
+    def copy(self):
+        # a copy to ingest into while the store serves this one. it shares
+        # what an ingest replaces rather than modifies and the student pages
+        # it leaves alone
+        catalog = copy.copy(self)
+        catalog.files, catalog.faculties = dict(self.files), dict(self.faculties)
+        catalog.retired = dict(self.retired)
+        catalog.categories = dict(self.categories)
+        catalog.students = self.students.copy()
+        return catalog
+
+    def number(self, part):
+        return list(self.files).index(part)
+
+    def replace(self, part):
+        # the file name to write a new or rewritten partition to in this
+        # generation, the file it had is retired
+        if part in self.files:
+            self.retired[self.files[part]] = time.time()
+            number = self.number(part)
+        else:
+            number = len(self.files)
+        self.files[part] = _file_name(number, self.generation)
+
+    def expire(self, directory):
+        # the retired files old enough to delete, dropped from the catalog.
+        # partition files it doesn't know of are left by an ingest that
+        # failed midway and are retired now
+        known = set(self.files.values()) | set(self.retired)
+        for name in os.listdir(directory):
+            if name.startswith('part-') and name not in known:
+                self.retired[name] = time.time()
+        expired = [name for name, retired in self.retired.items()
+                   if time.time() - retired >= PARTITION_RETIRE_SECONDS]
+        for name in expired:
+            del self.retired[name]
+        return expired
+
+    def student_parts(self, codes):
+        # the partitions any of the students (regnum codes) has rows in
+        parts = list(self.files)
+        return [parts[number] for number in self.students.numbers(codes)]
+
+    def add(self, part, data, codes=None):
+        # a new or rewritten partition, conformed to the catalog so its
+        # regnum codes are the catalog's. when only the students in codes
+        # can have come or gone, only their bits are written
+        self.faculties[part] = set(data['faculty'].dropna().unique().tolist())
+        present = data['regnum'].cat.codes.to_numpy()
+        number = self.number(part)
+        if codes is not None:
+            self.students.discard(codes, number)
+            present = present[np.isin(present, codes)]
+        self.students.add(present, number)
+
+    def extend(self, batch):
+        # the values of the batch added after the known categories, the way
+        # merge_batch extends the frame's
+        for column, categories in self.categories.items():
+            new = batch[column].astype('category').cat.categories
+            added = new[~new.isin(categories)]
+            if len(added):
+                self.categories[column] = categories.append(added)
+        self.empty = _conform(self.empty, self.categories)
+        self.rank_levels()
+
+
+def _write_catalog(catalog, directory):
+    tmp = os.path.join(directory, f"catalog.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, os.path.join(directory, 'catalog.pickle'))
+
+
+def read_catalog(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(partitions_path(path, snapshot_dir), 'catalog.pickle'), 'rb') as f:
+            catalog = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if catalog.signature != csv_signature(path, PARTITIONS_VERSION):
+        return None
+    return catalog
+
+
+def build_partitions(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # split the cleaned results into partition files next to a catalog,
+    # written to a new directory that then replaces the old one
+    signature = csv_signature(path, PARTITIONS_VERSION)
+    data = read_csv(path)
+    directory = partitions_path(path, snapshot_dir)
+    tmp = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    catalog = Catalog(data, signature)
+    for number, (part, rows) in enumerate(_split(data)):
+        catalog.files[part] = _file_name(number, catalog.generation)
+        catalog.add(part, rows)
+        write_feather(rows, os.path.join(tmp, catalog.files[part]))
+    _write_catalog(catalog, tmp)
+    old = f"{directory}.{os.getpid()}.old"
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info("wrote %d partitions of %s (%d rows)", len(catalog.files), path, len(data))
+    return catalog
+
+
+def publish_partitions(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # the catalog of the csv's partitions, built first if missing or stale
+    return publish_once(lambda: read_catalog(path, snapshot_dir),
+                        lambda: build_partitions(path, snapshot_dir), path, snapshot_dir)
+
+
+class Partition:
+    # one mapped partition file with its indexes
+
+    def __init__(self, data):
+        self.data = data
+        self.index = HierarchicalIndex(data)
+        self.students = StudentIndex(data)
+
+
+class PartitionedCube:
+    # StudentCube answers from the kept cells down to SHARED_DEPTH levels,
+    # deeper cells are counted on the partition of the selection
+
+    def __init__(self, store):
+        self.store = store
+
+    def counts(self, key, by, decision=None):
+        key = tuple(key)
+        if len(key) <= SHARED_DEPTH:
+            return self.store.catalog.cube.counts(key, by, decision)
+
+        def compute():
+            rows = self.store.rows(key)
+            if decision is not None:
+                rows = rows[rows['decision'] == decision]
+            if len(key) not in CUBE.get((by, decision is not None), ()) or rows.empty:
+                counts = pd.Series([], dtype='int64')
+            else:
+                counts = distinct_students(rows, [by])
+            return pd.Series(counts.to_numpy(dtype='int64'),
+                             index=pd.Index(counts.index.tolist(), name=by, dtype=object),
+                             dtype='int64')
+        return self.store.memo(('counts', key, by, decision), compute)
+
+    def total(self, key, decision=None):
+        key = tuple(key)
+        if len(key) <= SHARED_DEPTH:
+            return self.store.catalog.cube.total(key, decision)
+        if decision is not None:
+            return int(self.counts(key, 'decision').get(decision, 0))
+        return self.store.memo(('total', key),
+                               lambda: int(self.store.rows(key)['regnum'].nunique()))
+
+
+class PartitionedStudents:
+    # StudentIndex over the partitions a student has rows in
+
+    def __init__(self, store):
+        self.store = store
+
+    def rows(self, regnum):
+        catalog = self.store.catalog
+        try:
+            code = catalog.categories['regnum'].get_loc(regnum)
+        except KeyError:
+            return catalog.empty
+        parts = catalog.student_parts(np.array([code]))
+        return self.store.in_frame_order(
+            [self.store.partition(part).students.rows(regnum) for part in parts])
+
+
+class PartitionedStore(BaseStore):
+    # ResultsStore over year/semester partitions. only the catalog is read
+    # at startup, a partition is mapped when a view needs it and dropped
+    # once PARTITION_CACHE_SIZE others were used since, so memory stays flat
+    # as years of results pile up
+
+    def __init__(self, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.directory = partitions_path(path, snapshot_dir)
+        self.version = 0
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self.partitions = LRUCache(PARTITION_CACHE_SIZE)
+        self.queries = LRUCache(QUERY_CACHE_SIZE)
+        self.subsets = TTLCache(SUBSET_CACHE_SIZE, SUBSET_TTL)
+        self.cube = PartitionedCube(self)
+        self.students = PartitionedStudents(self)
+        self.reload()
+
+    def reload(self):
+        self._swap(publish_partitions(self.path, self.snapshot_dir))
+
+    def _swap(self, catalog):
+        options = OptionTree(catalog.keys)
+        with self._lock:
+            self.catalog, self.modules, self.options = catalog, catalog.modules, options
+            self.search = catalog.search
+            self.version += 1
+        self.partitions.clear()
+        self.queries.clear()
+        self.subsets.clear()
+        logger.info("results store at version %d (%d partitions)",
+                    self.version, len(catalog.files))
+        for listener in self.listeners:
+            listener(self)
+
+    def partition(self, part):
+        catalog, version = self.catalog, self.version
+
+        def load():
+            data = map_feather(os.path.join(self.directory, catalog.files[part]))
+            return Partition(_conform(data, catalog.categories))
+        try:
+            return self.partitions.get_or_compute((part, version), load)
+        except FileNotFoundError:
+            # retired by ingests of other workers this one missed reloading for
+            self.reload()
+            if self.catalog.generation == catalog.generation:
+                raise
+            return self.partition(part)
+
+    def parts(self, key):
+        # the partitions a selection can have rows in, pruned on its
+        # faculty, year and semester
+        catalog = self.catalog
+        selected = tuple(key[SHARED_DEPTH:])
+        return [part for part in catalog.files
+                if part[:len(selected)] == selected
+                and (not key or key[0] in catalog.faculties[part])]
+
+    def rows(self, key):
+        # the rows of a selection in frame order
+        return self.in_frame_order([self.partition(part).index.slice(*key)
+                                    for part in self.parts(key)])
+
+    def in_frame_order(self, frames):
+        # rows of several partitions in the order the pandas store keeps
+        # them: sorted on the LEVELS codes, missing values last, then in csv
+        # order. the rows of one partition already are
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return self.catalog.empty
+        if len(frames) == 1:
+            return frames[0]
+        data = pd.concat(frames)
+        keys = [np.arange(len(data))]
+        for level in reversed(LEVELS):
+            codes = data[level].cat.codes.to_numpy()
+            keys.append(np.where(codes < 0, len(data[level].cat.categories), codes))
+        return data.iloc[np.lexsort(keys)]
+
+    def ingest(self, batch):
+        # merge a cleaned batch into the partitions it lands in and drop the
+        # rows it replaces from the other partitions of its students. the
+        # kept aggregates move by the difference of those students' rows
+        # before and after, the module stats are recomputed for their
+        # programmes. the rewritten partitions are new files of the next
+        # generation, so the old catalog (of this worker until the swap, of
+        # the others until they reload) keeps reading the old ones, and the
+        # new catalog replaces the old one in one rename
+        with self._ingest_lock:
+            catalog = self.catalog.copy()
+            catalog.generation += 1
+            missing = set(catalog.empty.columns) ^ set(batch.columns)
+            if missing:
+                raise ValueError(f"batch columns differ from the results: {sorted(missing, key=str)}")
+            catalog.extend(batch)
+            batch = _conform(batch[catalog.empty.columns], catalog.categories)
+            incoming = dict(_split(batch))
+            codes = batch['regnum'].cat.codes.to_numpy()
+            affected = set(incoming)
+            affected.update(catalog.student_parts(codes))
+            pairs = pd.MultiIndex.from_arrays([batch['regnum'], batch['module']])
+            faculties = set(batch['faculty'].dropna().unique().tolist())
+            # the rows of the batch's students in every partition they are
+            # in. rows missing a regnum count as one student, in all of them
+            students = set(affected)
+            if batch['regnum'].isna().any():
+                students.update(catalog.files)
+            before = {part: _conform(self.partition(part).students.select(batch['regnum']),
+                                     catalog.categories)
+                      for part in students if part in self.catalog.files}
+            written = {}
+            for part in affected:
+                if part in catalog.files:
+                    data = _conform(self.partition(part).data, catalog.categories)
+                else:
+                    data = catalog.empty
+                superseded = pd.MultiIndex.from_arrays(
+                    [data['regnum'], data['module']]).isin(pairs)
+                if part not in incoming and not superseded.any():
+                    continue
+                faculties.update(data['faculty'][superseded].dropna().unique().tolist())
+                data = data[~superseded].reset_index(drop=True)
+                if part in incoming:
+                    data, _, _ = merge_batch(data, incoming[part], StudentIndex(data))
+                catalog.replace(part)
+                write_feather(data, os.path.join(self.directory, catalog.files[part]))
+                catalog.add(part, data, codes)
+                written[part] = data
+
+            after = {part: StudentIndex(written[part]).select(batch['regnum'])
+                     if part in written else before.get(part, catalog.empty)
+                     for part in students}
+            before = pd.concat([catalog.empty, *before.values()], ignore_index=True)
+            after = pd.concat([catalog.empty, *after.values()], ignore_index=True)
+            catalog.cube = catalog.cube.updated(before, after)
+
+            # all the rows of the programmes those students are in, for
+            # their module stats
+            programmes = set()
+            for rows in (before, after):
+                names = rows[['faculty', 'programme']].dropna()
+                programmes.update(zip(names['faculty'].tolist(), names['programme'].tolist()))
+            touched = {faculty for faculty, _ in programmes}
+            touched = [written[part] if part in written
+                       else _conform(self.partition(part).data, catalog.categories)
+                       for part, names in catalog.faculties.items() if names & touched]
+            touched = [data[pd.MultiIndex.from_arrays([data['faculty'], data['programme']])
+                            .isin(programmes)] for data in touched]
+            touched = pd.concat([catalog.empty, *touched], ignore_index=True)
+            catalog.modules = catalog.modules.updated(touched, programmes)
+            catalog.search = catalog.search.updated(batch)
+            # a full key ends in the year and semester of its partition, the
+            # rewritten partitions replace all of theirs
+            catalog.keys = [key for key in catalog.keys if key[SHARED_DEPTH:] not in written]
+            for data in written.values():
+                catalog.keys += [key for key in HierarchicalIndex(data).bounds
+                                 if len(key) == len(LEVELS)]
+            catalog.keys.sort(key=catalog.level_rank)
+            expired = catalog.expire(self.directory)
+            _write_catalog(catalog, self.directory)
+            self._swap(catalog)
+            for name in expired:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        logger.info("ingested %d results into %d partitions touching %d faculties",
+                    len(batch), len(written), len(faculties))
+
+
+if __name__ == "__main__":
+    # build the partitions ahead of starting the server workers
+    logging.basicConfig(level=logging.INFO)
+    publish_partitions()
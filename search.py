@@ -0,0 +1,180 @@
+import copy
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+# the columns a student is found by, in the order of the labels
+SEARCH_COLUMNS = ['regnum', 'firstnames', 'surname']
+# matches returned per query
+SEARCH_LIMIT = 10
+# candidates checked against the other words of a query at a time
+SEARCH_CHUNK = 256
+# words are split like the dropdown's own filter splits the labels, so the
+# options the server returns are the ones the browser keeps
+WORD = re.compile(r"[^\w\-']+")
+
+
+def words(text):
+    return [word for word in WORD.split(str(text).lower()) if word]
+
+
+def student_names(data):
+    # one row per student (their last result) with the searched columns
+    names = data[SEARCH_COLUMNS].drop_duplicates(['regnum'], keep='last')
+    return names[names['regnum'].notna()].reset_index(drop=True)
+
+
+def _column_words(column):
+    # the words of every distinct value of a column, split once, and the
+    # value of every student as a code into them (missing values last)
+    column = column.astype('category')
+    values = [words(value) for value in column.cat.categories] + [[]]
+    codes = column.cat.codes.to_numpy().astype('int64')
+    return values, np.where(codes < 0, len(values) - 1, codes)
+
+
+def _pairs(values, codes, vocabulary):
+    # (student, word id) pairs of a column
+    lengths = np.array([len(value) for value in values], dtype='int64')
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    flat = np.array([vocabulary[word] for value in values for word in value], dtype='int64')
+    counts = lengths[codes]
+    students = np.repeat(np.arange(len(codes)), counts)
+    starts = np.repeat(offsets[codes] - (np.cumsum(counts) - counts), counts)
+    return students, flat[starts + np.arange(counts.sum())]
+
+
+def _merged(first, second, new_first, new_second, size):
+    # pairs sorted by (first, second) with the new pairs inserted in place
+    key = first * size + second
+    new = np.argsort(new_first * size + new_second, kind='stable')
+    at = np.searchsorted(key, new_first[new] * size + new_second[new])
+    return np.insert(first, at, new_first[new]), np.insert(second, at, new_second[new])
+
+
+class StudentSearch:
+    # prefix index over the words of every student's regnum and names. the
+    # distinct words are a sorted list, so the words starting with a prefix
+    # are one bisect away, and the (word, student) pairs are sorted by word
+    # so the students having them are one slice. a query matches the
+    # students having a word starting with each of its words, like the
+    # dropdown filter
+
+    def __init__(self, names):
+        self.values = [names[column].to_numpy(dtype=object) for column in SEARCH_COLUMNS]
+        # regnum -> student number
+        self.numbers = {regnum: i for i, regnum in enumerate(self.values[0].tolist())}
+        columns = [_column_words(names[column]) for column in SEARCH_COLUMNS]
+        self.vocabulary = sorted({word for values, _ in columns
+                                  for value in values for word in value})
+        ids = {word: i for i, word in enumerate(self.vocabulary)}
+        pairs = [_pairs(values, codes, ids) for values, codes in columns]
+        students = np.concatenate([students for students, _ in pairs])
+        word_ids = np.concatenate([word_ids for _, word_ids in pairs])
+
+        order = np.lexsort([students, word_ids])
+        self.words, self.students = word_ids[order], students[order]
+        # and by student, to check the other words of a query
+        order = np.lexsort([word_ids, students])
+        self.student_words = word_ids[order]
+        self.offsets = np.searchsorted(students[order], np.arange(len(names) + 1))
+        self.width = int(np.diff(self.offsets).max(initial=0))
+
+    def updated(self, batch):
+        # a copy with the names of the students in a batch of results
+        # replaced (they keep their number) or added after the others. only
+        # their words are split, their new words are spliced into the
+        # vocabulary and their pairs merged into the sorted arrays
+        names = student_names(batch)
+        search = copy.copy(self)
+        search.numbers = dict(self.numbers)
+        changed = np.array([search.numbers.setdefault(regnum, len(search.numbers))
+                            for regnum in names['regnum'].tolist()], dtype='int64')
+        count = len(search.numbers)
+        search.values = []
+        for column, old in zip(SEARCH_COLUMNS, self.values):
+            values = np.empty(count, dtype=object)
+            values[:len(old)] = old
+            values[changed] = names[column].to_numpy(dtype=object)
+            search.values.append(values)
+
+        texts, students = [], []
+        for values in search.values:
+            for student in changed.tolist():
+                value = values[student]
+                found = words(value) if value == value else []
+                texts += found
+                students += [student] * len(found)
+        students = np.array(students, dtype='int64')
+
+        # new words go in at their sorted place, the ids after them move up
+        added = sorted({text for text in texts if not self._known(text)})
+        at = np.array([bisect_left(self.vocabulary, text) for text in added], dtype='int64')
+        search.vocabulary, start = [], 0
+        for text, stop in zip(added, at.tolist()):
+            search.vocabulary += self.vocabulary[start:stop]
+            search.vocabulary.append(text)
+            start = stop
+        search.vocabulary += self.vocabulary[start:]
+
+        def moved(ids):
+            return ids + np.searchsorted(at, ids, side='right')
+        word_ids = np.array([bisect_left(search.vocabulary, text) for text in texts], dtype='int64')
+        size = len(search.vocabulary)
+
+        # by word, then by student
+        kept = ~np.isin(self.students, changed)
+        search.words, search.students = _merged(
+            moved(self.words[kept]), self.students[kept], word_ids, students, count)
+        owners = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        kept = ~np.isin(owners, changed)
+        owners, search.student_words = _merged(
+            owners[kept], moved(self.student_words[kept]), students, word_ids, size)
+        search.offsets = np.searchsorted(owners, np.arange(count + 1))
+        search.width = int(np.diff(search.offsets).max(initial=0))
+        return search
+
+    def _known(self, text):
+        at = bisect_left(self.vocabulary, text)
+        return at < len(self.vocabulary) and self.vocabulary[at] == text
+
+    def _words(self, prefix):
+        # word ids starting with prefix
+        return (bisect_left(self.vocabulary, prefix),
+                bisect_left(self.vocabulary, prefix + '\U0010ffff'))
+
+    def _having(self, students, first, last):
+        # which of students have a word id in [first, last)
+        starts, stops = self.offsets[students], self.offsets[students + 1]
+        having = np.zeros(len(students), dtype=bool)
+        for i in range(self.width):
+            word = self.student_words[np.minimum(starts + i, len(self.student_words) - 1)]
+            having |= (starts + i < stops) & (word >= first) & (word < last)
+        return having
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        # [(regnum, label)] of up to limit students, by matching word
+        ranges = [self._words(word) for word in words(query)]
+        if not ranges:
+            return []
+        # walk the students of the rarest word and check the others
+        spans = [tuple(np.searchsorted(self.words, word_range)) for word_range in ranges]
+        first = min(range(len(ranges)), key=lambda i: spans[i][1] - spans[i][0])
+        start, stop = spans[first]
+        others = ranges[:first] + ranges[first + 1:]
+        found = {}
+        for chunk in range(start, stop, SEARCH_CHUNK):
+            students = self.students[chunk:min(chunk + SEARCH_CHUNK, stop)]
+            for other in others:
+                students = students[self._having(students, *other)]
+            for student in students.tolist():
+                found[student] = None
+                if len(found) == limit:
+                    return self._results(found)
+        return self._results(found)
+
+    def _results(self, students):
+        rows = [[values[student] for values in self.values] for student in students]
+        return [(row[0], ' '.join(str(value) for value in row if value == value))
+                for row in rows]
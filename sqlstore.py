@@ -0,0 +1,342 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import PASS_MARK, ModuleStats
+from cache import LRUCache, TTLCache
+from dataset import (DATA_PATH, LEVELS, SCHEMA, SNAPSHOT_DIR, OptionTree,
+                     csv_signature, publish_once)
+from search import SEARCH_COLUMNS, StudentSearch
+from store import SUBSET_CACHE_SIZE, SUBSET_TTL, BaseStore
+
+# version of the tables and indexes, see csv_signature
+DATABASE_VERSION = 1
+# csv rows parsed and inserted at a time while building the database, so
+# building never holds more than this many rows in memory
+INSERT_CHUNK_ROWS = 100_000
+# query results kept until the results change
+QUERY_CACHE_SIZE = 1024
+# bytes of the database read through a memory mapping, so server workers
+# share the pages of the os cache
+MMAP_SIZE = 1 << 30
+
+logger = logging.getLogger(__name__)
+
+
+def database_path(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(snapshot_dir, f"{name}.sqlite")
+
+
+def _param(value):
+    # sqlite only binds python scalars
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _rows(frame):
+    # frame rows as tuples of python values, missing values as NULL
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), None).itertuples(index=False, name=None)
+
+
+def _filter(key, decision=None):
+    # where clause and parameters selecting a LEVELS prefix. IS rather
+    # than = so missing values select each other like the pandas store
+    columns = LEVELS[:len(key)] + (['decision'] if decision is not None else [])
+    params = list(key) + ([decision] if decision is not None else [])
+    where = " AND ".join(f"{column} IS ?" for column in columns) or "1"
+    return where, [_param(value) for value in params]
+
+
+def _add_ranks(con, first=0):
+    # rank every level value first seen from rowid first on, by the row it
+    # first appears in, the category order sort_dataframe gives the frame
+    for level in LEVELS:
+        con.execute(
+            f"INSERT INTO ranks SELECT ?, {level}, MIN(rowid) FROM results "
+            f"WHERE rowid >= ? AND {level} IS NOT NULL AND {level} NOT IN "
+            f"(SELECT value FROM ranks WHERE level = ?) GROUP BY {level}",
+            (level, first, level))
+
+
+def database_current(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    db_path = database_path(path, snapshot_dir)
+    if not os.path.exists(db_path):
+        return False
+    try:
+        con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            meta = dict(con.execute("SELECT key, value FROM meta"))
+        finally:
+            con.close()
+    except sqlite3.Error:
+        return False
+    return meta == csv_signature(path, DATABASE_VERSION)
+
+
+def _numeric(values):
+    # whether _infer_categories would turn these values into numbers
+    try:
+        pd.to_numeric(values)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+def build_database(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # load the csv into an indexed sqlite database a chunk at a time, with
+    # the cleaning of clean_dataframe done in sql. the rows are staged as
+    # text first; columns whose values are all numbers then get NUMERIC
+    # affinity, so academic years, semesters and marks come back as numbers
+    # and mixed columns like grade stay text, as in the pandas frame
+    signature = csv_signature(path, DATABASE_VERSION)
+    db_path = database_path(path, snapshot_dir)
+    tmp = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    columns = [column for column in pd.read_csv(path, nrows=0).columns
+               if column in SCHEMA]
+    numeric = dict.fromkeys(columns, True)
+    con = sqlite3.connect(tmp)
+    try:
+        con.execute(f"CREATE TEMP TABLE csv ({', '.join(columns)})")
+        insert = f"INSERT INTO csv VALUES ({', '.join('?' * len(columns))})"
+        with pd.read_csv(path, usecols=columns, dtype=str,
+                         chunksize=INSERT_CHUNK_ROWS) as reader:
+            for chunk in reader:
+                chunk = chunk[columns]
+                if 'gender' in chunk:
+                    chunk['gender'] = chunk['gender'].replace(
+                        {'female': 'Female', 'male': 'Male'})
+                for column in columns:
+                    if numeric[column]:
+                        numeric[column] = _numeric(chunk[column].dropna().unique())
+                con.executemany(insert, _rows(chunk))
+        affinity = {column: 'NUMERIC' if numeric[column] else 'TEXT' for column in columns}
+        con.execute(f"CREATE TABLE results ({', '.join(f'{c} {affinity[c]}' for c in columns)})")
+        con.execute("CREATE TABLE ranks (level TEXT, value, rank INTEGER)")
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+        # drop_duplicates(['regnum', 'module'], keep='last'), in csv order
+        con.execute("INSERT INTO results SELECT * FROM csv WHERE rowid IN "
+                    "(SELECT MAX(rowid) FROM csv GROUP BY regnum, module) ORDER BY rowid")
+        con.execute("DROP TABLE csv")
+        con.execute(f"CREATE INDEX results_levels ON results ({', '.join(LEVELS)})")
+        con.execute("CREATE INDEX results_student ON results (regnum, module)")
+        _add_ranks(con)
+        con.executemany("INSERT INTO meta VALUES (?, ?)", signature.items())
+        con.execute("ANALYZE")
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, db_path)
+
+
+def publish_database(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # the database of the csv, built first if it is missing or stale
+    def build():
+        build_database(path, snapshot_dir)
+        logger.info("built database of %s", path)
+        return True
+    publish_once(lambda: database_current(path, snapshot_dir) or None, build,
+                 path, snapshot_dir)
+    return database_path(path, snapshot_dir)
+
+
+class SqlCube:
+    # StudentCube's distinct student counts as COUNT(DISTINCT regnum)
+    # queries over the levels index
+
+    def __init__(self, store):
+        self.store = store
+
+    def counts(self, key, by, decision=None):
+        if by not in self.store.columns:
+            rows = []
+        else:
+            where, params = _filter(key, decision)
+            rows = self.store.query(
+                f"SELECT {by}, COUNT(DISTINCT regnum) FROM results "
+                f"WHERE {where} AND {by} IS NOT NULL AND regnum IS NOT NULL "
+                f"GROUP BY {by} ORDER BY {by}", params)
+        if by in LEVELS:
+            rows = sorted(rows, key=lambda row: self.store.rank(by, row[0]))
+        labels = [label for label, _ in rows]
+        return pd.Series([count for _, count in rows],
+                         index=pd.Index(labels, name=by, dtype=object), dtype='int64')
+
+    def total(self, key, decision=None):
+        where, params = _filter(key, decision)
+        return self.store.query(
+            f"SELECT COUNT(DISTINCT regnum) FROM results WHERE {where}", params)[0][0]
+
+
+class SqlModuleStats:
+    # ModuleStats of one programme, computed from its rows
+
+    def __init__(self, store):
+        self.store = store
+
+    def programme(self, faculty, programme):
+        def compute():
+            data = self.store.frame(
+                "SELECT faculty, programme, module, grade, mark FROM results "
+                "WHERE faculty IS ? AND programme IS ?", [faculty, programme])
+            data = data.astype({'faculty': 'category', 'programme': 'category',
+                                'module': 'category'})
+            # a column for every grade of the results, as in the frame, not
+            # just the ones this programme has
+            data['grade'] = pd.Categorical(data['grade'], categories=self.grades())
+            data['mark'] = pd.to_numeric(data['mark'])
+            return ModuleStats(data).programme(faculty, programme)
+        return self.store.memo(('modules', faculty, programme), compute)
+
+    def grades(self):
+        rows = self.store.query("SELECT DISTINCT grade FROM results WHERE grade IS NOT NULL")
+        return sorted(grade for grade, in rows)
+
+    def pass_rates(self, faculty):
+        # ModuleStats.pass_rates grouped in sql and pivoted here
+        def compute():
+            data = self.store.frame(
+                f"SELECT programme, module, 100.0 * TOTAL(mark >= {PASS_MARK}) / COUNT(*) "
+                "AS pass_rate FROM results WHERE faculty IS ? AND programme IS NOT NULL "
+                "AND module IS NOT NULL GROUP BY programme, module ORDER BY module", [faculty])
+            rates = data.pivot(index='programme', columns='module', values='pass_rate')
+            programmes = sorted(rates.index, key=lambda value: self.store.rank('programme', value))
+            return rates.reindex(programmes).astype('float64')
+        return self.store.memo(('pass_rates', faculty), compute)
+
+
+class SqlStudents:
+    # StudentIndex over the regnum index
+
+    def __init__(self, store):
+        self.store = store
+
+    def rows(self, regnum):
+        data = self.store.frame("SELECT rowid, * FROM results WHERE regnum IS ?", [regnum])
+        return self.store.in_frame_order(data).drop(columns='rowid')
+
+
+class SqliteStore(BaseStore):
+    # ResultsStore served from an indexed sqlite database next to the csv
+    # rather than a frame in memory. filters and distinct student counts run
+    # as sql, so results larger than memory stay queryable and starting up
+    # only reads the dropdown options
+
+    def __init__(self, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.db_path = database_path(path, snapshot_dir)
+        self.version = 0
+        self.listeners = []
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self._local = threading.local()
+        self.subsets = TTLCache(SUBSET_CACHE_SIZE, SUBSET_TTL)
+        self.queries = LRUCache(QUERY_CACHE_SIZE)
+        self.cube = SqlCube(self)
+        self.modules = SqlModuleStats(self)
+        self.students = SqlStudents(self)
+        self.reload()
+
+    def connection(self):
+        # one connection per thread, reopened after the database is rebuilt
+        # and in forked processes, which must not share the parent's
+        local = self._local
+        opened = (self.db_path, self._generation, os.getpid())
+        if getattr(local, 'opened', None) != opened:
+            local.connection = sqlite3.connect(self.db_path)
+            local.connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            local.opened = opened
+        return local.connection
+
+    def reload(self):
+        self.db_path = publish_database(self.path, self.snapshot_dir)
+        self._generation += 1
+        self._swap()
+
+    def ingest(self, batch):
+        # append a cleaned batch of results and delete the rows of the same
+        # student and module it replaces
+        with self._ingest_lock:
+            if set(batch.columns) != set(self.columns):
+                missing = set(batch.columns) ^ set(self.columns)
+                raise ValueError(f"batch columns differ from the results: {sorted(missing, key=str)}")
+            con = self.connection()
+            with con:
+                first = con.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM results").fetchone()[0]
+                con.executemany(
+                    f"INSERT INTO results ({', '.join(self.columns)}) "
+                    f"VALUES ({', '.join('?' * len(self.columns))})", _rows(batch[self.columns]))
+                con.executemany(
+                    "DELETE FROM results WHERE regnum IS ? AND module IS ? AND rowid < ?",
+                    (pair + (first,) for pair in _rows(batch[['regnum', 'module']])))
+                _add_ranks(con, first)
+            # the batch rows are every one of their students' last row now
+            self._swap(self.search.updated(batch))
+        logger.info("ingested %d results", len(batch))
+
+    def _swap(self, search=None):
+        con = self.connection()
+        columns = [row[1] for row in con.execute("PRAGMA table_info(results)")]
+        ranks = {level: dict(con.execute("SELECT value, rank FROM ranks WHERE level = ?",
+                                         (level,)))
+                 for level in LEVELS}
+        keys = con.execute(f"SELECT DISTINCT {', '.join(LEVELS)} FROM results").fetchall()
+        keys.sort(key=lambda key: [ranks[level].get(value, sys.maxsize)
+                                   for level, value in zip(LEVELS, key)])
+        options = OptionTree(keys)
+        # the search over every student's last row, held in memory
+        if search is None:
+            search = StudentSearch(self.frame(
+                f"SELECT {', '.join(SEARCH_COLUMNS)} FROM results WHERE rowid IN "
+                "(SELECT MAX(rowid) FROM results WHERE regnum IS NOT NULL GROUP BY regnum)"))
+        with self._lock:
+            self.columns, self.ranks, self.options = columns, ranks, options
+            self.search = search
+            self.version += 1
+        self.queries.clear()
+        self.subsets.clear()
+        logger.info("results store at version %d", self.version)
+        for listener in self.listeners:
+            listener(self)
+
+    def rank(self, level, value):
+        # position of a level value in frame order, missing values last
+        return self.ranks[level].get(value, sys.maxsize)
+
+    def query(self, sql, params=()):
+        params = tuple(_param(value) for value in params)
+        return self.memo((sql, params),
+                         lambda: self.connection().execute(sql, params).fetchall())
+
+    def frame(self, sql, params=()):
+        return pd.read_sql_query(sql, self.connection(),
+                                 params=[_param(value) for value in params])
+
+    def in_frame_order(self, data):
+        # rows in the order the pandas store keeps them: sorted on LEVELS by
+        # first appearance, then in csv order
+        keys = [data['rowid'].to_numpy()]
+        keys += [data[level].map(lambda value, level=level: self.rank(level, value)).to_numpy()
+                 for level in reversed(LEVELS)]
+        return data.iloc[np.lexsort(keys)]
+
+    def rows(self, key):
+        # the rows of a selection in frame order
+        where, params = _filter(key)
+        data = self.frame(f"SELECT rowid, * FROM results WHERE {where}", params)
+        return self.in_frame_order(data).drop(columns='rowid')
+
+
+if __name__ == "__main__":
+    # build the database ahead of starting the server workers
+    logging.basicConfig(level=logging.INFO)
+    publish_database()
@@ -0,0 +1,111 @@
+import logging
+import threading
+
+from aggregates import ModuleStats, StudentCube
+from cache import TTLCache
+from dataset import (DATA_PATH, SNAPSHOT_DIR, HierarchicalIndex, OptionTree,
+                     StudentIndex, load_dataframe, merge_batch, write_generation)
+from search import StudentSearch, student_names
+
+# result level columns left out of the one row per student decision lists
+ROSTER_DROP = ['mark', 'grade', 'faculty', 'programme', 'programmetype',
+               'attendancetype', 'module', 'programmestatus']
+
+# filtered subsets the callbacks fired by one user action share. they only
+# need to outlive that burst of requests
+SUBSET_CACHE_SIZE = 64
+SUBSET_TTL = 30
+
+logger = logging.getLogger(__name__)
+
+
+def roster_frame(rows):
+    # one row per student (their last result) of rows in frame order, with
+    # the regnum doubling as the row id of the tables
+    df = rows.drop_duplicates(['regnum'], keep='last')
+    df = df.drop(ROSTER_DROP, axis=1)
+    df['id'] = df.regnum
+    return df
+
+
+class BaseStore:
+    # what every store builds the same way on its rows(key) of a filter
+    # selection, cached for the version of the results
+
+    def subset(self, name, key, compute):
+        # compute() once for (name, key) and this version, shared by every
+        # caller within SUBSET_TTL. callers must not modify the result
+        return self.subsets.get_or_compute((name, key, self.version), compute)
+
+    def memo(self, key, compute):
+        # compute() once per key until the results change, in the query
+        # cache of the stores that keep one
+        return self.queries.get_or_compute((key, self.version), compute)
+
+    def roster(self, *key):
+        return self.subset('roster', key, lambda: roster_frame(self.rows(key)))
+
+
+class ResultsStore(BaseStore):
+    # the results frame and everything derived from it. callbacks read
+    # through the store so a reload swaps the frame, indexes, dropdown
+    # options and aggregates together and bumps the version that caches are
+    # keyed on
+
+    def __init__(self, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.version = 0
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self.subsets = TTLCache(SUBSET_CACHE_SIZE, SUBSET_TTL)
+        self.reload()
+
+    def reload(self):
+        self.replace(load_dataframe(self.path, self.snapshot_dir))
+
+    def replace(self, data):
+        self._swap(data, HierarchicalIndex(data), StudentIndex(data), StudentCube(data),
+                   ModuleStats(data), StudentSearch(student_names(data)))
+
+    def ingest(self, batch):
+        # merge a cleaned batch of results. the students in the batch are
+        # the only ones whose rows change, so the index bounds and student
+        # counts move by the difference of their rows before and after, and
+        # the module stats are recomputed for the programmes they are in.
+        # the merged frame is written as the next generation of the snapshot
+        # and served from its mapping, which the other workers map too when
+        # they reload
+        with self._ingest_lock:
+            before = self.students.select(batch['regnum'])
+            data, faculties, students = merge_batch(self.data, batch, self.students)
+            data = write_generation(data, self.path, self.snapshot_dir)
+            # the same rows, the index just reads them from the mapping now
+            students.data = data
+            after = students.select(batch['regnum'])
+            index = self.index.updated(data, before, after)
+            programmes = set()
+            for rows in (before, after):
+                pairs = rows[['faculty', 'programme']].dropna()
+                programmes.update(zip(pairs['faculty'].tolist(), pairs['programme'].tolist()))
+            self._swap(data, index, students, self.cube.updated(before, after),
+                       self.modules.updated(index.select(programmes), programmes),
+                       self.search.updated(batch))
+        logger.info("ingested %d results touching %d faculties",
+                    len(batch), len(faculties))
+
+    def _swap(self, data, index, students, cube, modules, search):
+        options = OptionTree(index.bounds)
+        with self._lock:
+            self.data, self.index, self.options = data, index, options
+            self.students, self.cube, self.modules = students, cube, modules
+            self.search = search
+            self.version += 1
+        self.subsets.clear()
+        logger.info("results store at version %d", self.version)
+        for listener in self.listeners:
+            listener(self)
+
+    def rows(self, key):
+        return self.index.slice(*key)
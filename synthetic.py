@@ -0,0 +1,155 @@
+import argparse
+import string
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATA_PATH
+
+# the university the synthetic results come from. every faculty offers the
+# same number of programmes, every programme the same number of modules per
+# year and semester, so the row count only scales the number of students
+FACULTIES = ['Faculty of Agriculture', 'Faculty of Arts', 'Faculty of Commerce',
+             'Faculty of Education', 'Faculty of Engineering', 'Faculty of Law',
+             'Faculty of Medicine', 'Faculty of Science']
+PROGRAMMES_PER_FACULTY = 6
+YEARS = [1, 2, 3, 4]
+SEMESTERS = [1, 2]
+MODULES_PER_SEMESTER = 6
+ATTENDANCE_TYPES = ['Conventional', 'Parallel', 'Block', 'Visiting']
+ATTENDANCE_WEIGHTS = [0.6, 0.2, 0.15, 0.05]
+# raw csv spellings, cleaned up by clean_dataframe
+GENDERS = ['Male', 'Female', 'male', 'female']
+GENDER_WEIGHTS = [0.45, 0.45, 0.05, 0.05]
+FIRSTNAMES = ['Tendai', 'Tatenda', 'Rutendo', 'Farai', 'Nyasha', 'Chipo',
+              'Tinashe', 'Kudzai', 'Rumbidzai', 'Tafadzwa', 'Blessing',
+              'Precious', 'Takudzwa', 'Vimbai', 'Tonderai', 'Ruvimbo',
+              'Simbarashe', 'Fadzai', 'Munyaradzi', 'Chiedza', 'Tapiwa',
+              'Nokuthula', 'Sipho', 'Thandiwe', 'Brian', 'Grace', 'John',
+              'Mary', 'Joseph', 'Ruth']
+SURNAMES = ['Moyo', 'Ncube', 'Sibanda', 'Dube', 'Mpofu', 'Ndlovu', 'Nyathi',
+            'Chirwa', 'Mutasa', 'Chikwanha', 'Mhlanga', 'Mapfumo', 'Zhou',
+            'Gumbo', 'Shumba', 'Marufu', 'Banda', 'Phiri', 'Tshuma', 'Mlambo',
+            'Moyana', 'Chigumba', 'Nhema', 'Mazango', 'Hove', 'Makoni',
+            'Chinoda', 'Sithole', 'Mashava', 'Kapfumo']
+GRADES = ['1', '2.1', '2.2', 'P', 'F']
+GRADE_MARKS = [75, 65, 60, 50, 0]
+# share of results that are resits of an earlier result of the same student
+# and module, later in the file, which the loader keeps instead
+RESIT_RATE = 0.01
+CHUNK_ROWS = 500_000
+
+COLUMNS = ['id', 'regnum', 'firstnames', 'surname', 'gender', 'faculty',
+           'programme', 'programmecode', 'programmetype', 'programmestatus',
+           'attendancetype', 'academicyear', 'semester', 'module', 'mark',
+           'grade', 'decision', 'mark.1']
+
+
+def programmes():
+    # (faculty, programme, code, type) of every programme
+    rows = []
+    for f, faculty in enumerate(FACULTIES):
+        subject = faculty.split()[-1]
+        for p in range(PROGRAMMES_PER_FACULTY):
+            kind = 'Postgraduate' if p == PROGRAMMES_PER_FACULTY - 1 else 'Undergraduate'
+            degree = 'Master' if kind == 'Postgraduate' else 'Bachelor'
+            rows.append((faculty, f"{degree} of {subject} {p + 1}",
+                         f"{subject[:3].upper()}{p + 1:02d}", kind))
+    return rows
+
+
+def _grades(marks):
+    grades = np.full(len(marks), len(GRADES) - 1)
+    for i in reversed(range(len(GRADES) - 1)):
+        grades[marks >= GRADE_MARKS[i]] = i
+    return np.array(GRADES, dtype=object)[grades]
+
+
+def _decisions(fails):
+    decisions = np.select([fails == 0, fails <= 3, fails <= 6],
+                          ['PASS', 'PROCEED & CARRY', 'REPEAT'], 'DISCONTINUE')
+    return decisions.astype(object)
+
+
+def generate(rows, seed=0, chunk_rows=CHUNK_ROWS):
+    # yields frames of about chunk_rows raw results each, rows in total,
+    # with the columns of the results csv. every student sits all modules
+    # of one year of their programme
+    rng = np.random.default_rng(seed)
+    catalogue = programmes()
+    per_student = len(SEMESTERS) * MODULES_PER_SEMESTER
+    # module codes and difficulty, fixed for the whole run
+    modules = np.array([[[f"{code}{y}{m + 1:02d}" for m in range(per_student)]
+                         for y in YEARS] for _, _, code, _ in catalogue], dtype=object)
+    difficulty = rng.normal(0, 6, modules.shape)
+    first_id = 0
+    first_student = 0
+    while first_id < rows:
+        size = min(chunk_rows, rows - first_id)
+        resits = int(size * RESIT_RATE)
+        students = -(-(size - resits) // per_student)
+
+        programme = rng.integers(0, len(catalogue), students)
+        year = rng.integers(0, len(YEARS), students)
+        attendance = rng.choice(len(ATTENDANCE_TYPES), students, p=ATTENDANCE_WEIGHTS)
+        gender = rng.choice(len(GENDERS), students, p=GENDER_WEIGHTS)
+        ability = rng.normal(65, 8, students)
+        regnum = np.array([f"R{first_student + s:07d}{string.ascii_uppercase[(first_student + s) % 26]}"
+                           for s in range(students)], dtype=object)
+        firstnames = np.array(FIRSTNAMES, dtype=object)[rng.integers(0, len(FIRSTNAMES), students)]
+        surname = np.array(SURNAMES, dtype=object)[rng.integers(0, len(SURNAMES), students)]
+
+        student = np.repeat(np.arange(students), per_student)
+        slot = np.tile(np.arange(per_student), students)
+        marks = (ability[student] - difficulty[programme[student], year[student], slot]
+                 + rng.normal(0, 10, len(student)))
+        marks = np.clip(np.rint(marks), 0, 100).astype('int64')
+        fails = np.bincount(student, weights=marks < 50, minlength=students)
+
+        # resits repeat a random result with a new mark
+        again = rng.integers(0, len(student), resits)
+        student = np.concatenate([student, student[again]])
+        slot = np.concatenate([slot, slot[again]])
+        marks = np.concatenate([marks, np.clip(marks[again] + rng.integers(0, 25, resits), 0, 100)])
+        student, slot, marks = student[:size], slot[:size], marks[:size]
+
+        p = programme[student]
+        info = np.array(catalogue, dtype=object)[p]
+        frame = pd.DataFrame({
+            'id': np.arange(first_id, first_id + size),
+            'regnum': regnum[student],
+            'firstnames': firstnames[student],
+            'surname': surname[student],
+            'gender': np.array(GENDERS, dtype=object)[gender[student]],
+            'faculty': info[:, 0],
+            'programme': info[:, 1],
+            'programmecode': info[:, 2],
+            'programmetype': info[:, 3],
+            'programmestatus': 'Active',
+            'attendancetype': np.array(ATTENDANCE_TYPES, dtype=object)[attendance[student]],
+            'academicyear': np.array(YEARS)[year[student]],
+            'semester': np.array(SEMESTERS)[slot // MODULES_PER_SEMESTER],
+            'module': modules[p, year[student], slot],
+            'mark': marks,
+            'grade': _grades(marks),
+            'decision': _decisions(fails)[student],
+            'mark.1': marks,
+        }, columns=COLUMNS)
+        yield frame
+        first_id += size
+        first_student += students
+
+
+def write_csv(path, rows, seed=0, chunk_rows=CHUNK_ROWS):
+    for i, frame in enumerate(generate(rows, seed, chunk_rows)):
+        frame.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="write synthetic results with the schema of the results csv")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.path, args.rows, args.seed)
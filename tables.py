@@ -0,0 +1,87 @@
+import math
+
+# server side filtering, sorting and paging for dash_table.DataTable with
+# page_action, sort_action and filter_action set to 'custom'. the filter
+# syntax follows the dash_table custom filtering docs
+OPERATORS = [['ge ', '>='],
+             ['le ', '<='],
+             ['lt ', '<'],
+             ['gt ', '>'],
+             ['ne ', '!='],
+             ['eq ', '='],
+             ['contains '],
+             ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if value_part and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value, value_part
+
+    return [None] * 4
+
+
+def _values(column):
+    # compare categoricals on their values, not on their category order
+    if column.dtype == 'category':
+        return column.astype(column.cat.categories.dtype)
+    return column
+
+
+def filter_frame(df, filter_query):
+    for filter_part in (filter_query or '').split(' && '):
+        name, operator, value, text = split_filter_part(filter_part)
+        if name not in df:
+            continue
+        values = _values(df[name])
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            if values.dtype == object:
+                value = value if isinstance(value, str) else text
+            elif isinstance(value, str):
+                # text filter on a numeric column matches nothing
+                df = df.iloc[0:0]
+                continue
+            df = df.loc[getattr(values, operator)(value)]
+        elif operator == 'contains':
+            df = df.loc[values.astype(str).str.contains(
+                str(value), case=False, regex=False)]
+        elif operator == 'datestartswith':
+            df = df.loc[values.astype(str).str.startswith(str(value))]
+    return df
+
+
+def sort_frame(df, sort_by):
+    sort_by = [col for col in sort_by or [] if col['column_id'] in df]
+    if not sort_by:
+        return df
+    return df.sort_values(
+        [col['column_id'] for col in sort_by],
+        ascending=[col['direction'] == 'asc' for col in sort_by],
+        kind='stable',
+        key=_values,
+    )
+
+
+def page_frame(df, page_current, page_size):
+    page_current = page_current or 0
+    return df.iloc[page_current * page_size:(page_current + 1) * page_size]
+
+
+def page_count(df, page_size):
+    return max(1, math.ceil(len(df) / page_size))
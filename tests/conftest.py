@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset  # noqa: E402
+import synthetic  # noqa: E402
+
+RESULTS_ROWS = 1200
+
+
+@pytest.fixture
+def results(tmp_path, monkeypatch):
+    # a small results csv at the default data path of a scratch directory,
+    # so the stores' snapshots land there too
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    raw = pd.concat(synthetic.generate(RESULTS_ROWS, seed=0))
+    raw.to_csv('data/new_data.csv', index=False)
+    return raw
+
+
+@pytest.fixture
+def batch(results):
+    # a batch that re-marks some results, adds other programmes' results to
+    # some students, adds students, moves results to a new faculty and has
+    # a result without a regnum, as raw csv rows. the rows first showing a
+    # level value are left alone, a reload would order the dropdowns by the
+    # rows after them while an ingest keeps the order it has
+    rng = np.random.default_rng(1)
+    first = np.zeros(len(results), dtype=bool)
+    for level in dataset.LEVELS:
+        first |= ~results[level].duplicated().to_numpy()
+    later = results[~first]
+    remarked = later.iloc[rng.choice(len(later) - 30, 40, replace=False)].copy()
+    remarked['mark'] = remarked['mark.1'] = rng.integers(0, 100, len(remarked))
+    other = next(synthetic.generate(600, seed=1))
+    keys = pd.MultiIndex.from_frame(results[['regnum', 'module']])
+    other = other[~pd.MultiIndex.from_frame(other[['regnum', 'module']]).isin(keys)].copy()
+    # the same students under the same names
+    names = results.drop_duplicates('regnum').set_index('regnum')
+    known = other['regnum'].isin(names.index)
+    for column in ['firstnames', 'surname', 'gender']:
+        other.loc[known, column] = other.loc[known, 'regnum'].map(names[column])
+    added = other.tail(24).copy()
+    added['regnum'] = [f"N{i:07d}X" for i in range(len(added))]
+    moved = later.iloc[-30:-18].copy()
+    moved['faculty'] = 'Faculty of Veterinary Science'
+    moved['programme'] = moved['programmecode'] = 'VET01'
+    unknown = later.tail(1).copy()
+    unknown['regnum'] = np.nan
+    rows = pd.concat([remarked, other.head(48), added, moved, unknown])
+    rows.to_csv('data/batch.csv', index=False)
+    return rows
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import plotly.graph_objects as go
+
+import cache
+from cache import LRUCache, TTLCache, memoize
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    lru.put('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    assert len(lru) == 2
+    assert lru.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1}
+    lru.clear()
+    assert len(lru) == 0
+
+
+def test_get_or_compute_computes_once():
+    lru = LRUCache(4)
+    calls = []
+
+    def compute():
+        # slow enough for the other threads to ask meanwhile
+        calls.append(1)
+        time.sleep(0.05)
+        return 'value'
+    threads = [threading.Thread(target=lambda: lru.get_or_compute('key', compute))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert lru.get_or_compute('key', compute) == 'value'
+
+
+def test_ttl_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    ttl = TTLCache(4, ttl=30)
+    ttl.put('a', 1)
+    now[0] += 29
+    assert ttl.get('a') == 1
+    now[0] += 2
+    assert ttl.get('a') is None
+    assert len(ttl) == 0
+
+
+def test_memoize_keys_on_inputs_and_version():
+    lru = LRUCache(8)
+    version = [0]
+    calls = []
+
+    @memoize(lru, lambda: version[0])
+    def figure(faculty, year=None):
+        calls.append((faculty, year))
+        return go.Figure(go.Bar(x=[faculty], y=[1]))
+
+    first = figure('Science')
+    # served as plain dicts, the same object on every hit
+    assert isinstance(first, dict) and first['data'][0]['x'] == ['Science']
+    assert figure('Science') is first
+    figure('Science', 2021)
+    assert calls == [('Science', None), ('Science', 2021)]
+    # a reload bumps the version, the old entries are never served again
+    version[0] += 1
+    assert figure('Science') is not first
+    assert calls[-1] == ('Science', None) and len(calls) == 3
+    assert figure.uncached('Arts').to_plotly_json()['data'][0]['x'] == ['Arts']
+
+
+def test_memoize_computes_unhashable_inputs():
+    lru = LRUCache(8)
+    calls = []
+
+    @memoize(lru, serialize=lambda value: value)
+    def total(values):
+        calls.append(values)
+        return sum(values)
+
+    assert total([1, 2]) == 3
+    assert total([1, 2]) == 3
+    assert len(calls) == 2 and len(lru) == 0
@@ -0,0 +1,78 @@
+import gzip
+
+import flask
+import pytest
+
+import compression
+from compression import STATIC_PREFIX, ResponseCompressor
+
+BODY = '{"rows": [%s]}' % ', '.join(['{"regnum": "R0000001", "mark": 55}'] * 200)
+
+
+@pytest.fixture
+def client():
+    server = flask.Flask(__name__)
+
+    @server.route('/json')
+    def json_body():
+        return flask.Response(BODY, mimetype='application/json')
+
+    @server.route('/small')
+    def small_body():
+        return flask.Response('{}', mimetype='application/json')
+
+    @server.route('/xlsx')
+    def xlsx_body():
+        return flask.Response(BODY, mimetype='application/vnd.ms-excel')
+
+    @server.route(STATIC_PREFIX + 'bundle.js')
+    def bundle():
+        return flask.Response(BODY, mimetype='application/javascript')
+
+    ResponseCompressor().init_app(server)
+    return server.test_client()
+
+
+@pytest.mark.parametrize('accept', ['gzip', 'gzip, deflate, br', 'deflate, gzip;q=0.5'])
+def test_gzip_when_accepted(client, monkeypatch, accept):
+    monkeypatch.setattr(compression, 'brotli', None)
+    response = client.get('/json', headers={'Accept-Encoding': accept})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()).decode() == BODY
+
+
+@pytest.mark.parametrize('accept', [None, 'identity', 'deflate', 'gzip;q=0', 'br'])
+def test_plain_unless_accepted(client, monkeypatch, accept):
+    monkeypatch.setattr(compression, 'brotli', None)
+    headers = {'Accept-Encoding': accept} if accept else {}
+    response = client.get('/json', headers=headers)
+    assert 'Content-Encoding' not in response.headers
+    # caches still have to tell the clients apart
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.get_data().decode() == BODY
+
+
+def test_brotli_preferred(client):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/json', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.get_data()).decode() == BODY
+
+
+@pytest.mark.parametrize('path', ['/small', '/xlsx'])
+def test_small_or_binary_sent_as_is(client, path):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_static_bodies_compressed_once(client, monkeypatch):
+    calls = []
+    compress = gzip.compress
+    monkeypatch.setattr(compression.gzip, 'compress',
+                        lambda *args: calls.append(1) or compress(*args))
+    monkeypatch.setattr(compression, 'brotli', None)
+    for _ in range(3):
+        response = client.get(STATIC_PREFIX + 'bundle.js', headers={'Accept-Encoding': 'gzip'})
+        assert gzip.decompress(response.get_data()).decode() == BODY
+    assert len(calls) == 1
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+
+
+def _cleaned(path):
+    # what parsing the whole csv in one go and cleaning it gives
+    data = pd.read_csv(path, usecols=lambda column: column in dataset.SCHEMA,
+                       dtype=dataset.SCHEMA)
+    return dataset.clean_dataframe(data)
+
+
+@pytest.mark.parametrize('chunk_rows', [dataset.MIN_CHUNK_ROWS, 100])
+def test_read_csv_matches_cleaning(results, monkeypatch, chunk_rows):
+    # resits repeat a student's module further down, here across chunks and
+    # dedupe blocks, next to missing regnums, levels and marks
+    rows = results.copy()
+    rows.loc[rows.index[::97], 'regnum'] = np.nan
+    rows.loc[rows.index[5::89], 'semester'] = np.nan
+    rows.loc[rows.index[7::83], 'mark'] = np.nan
+    resits = rows.sample(60, random_state=0)
+    resits['mark'] = resits['mark'] + 1
+    pd.concat([rows, resits]).to_csv('data/results.csv', index=False)
+    monkeypatch.setattr(dataset, 'MIN_CHUNK_ROWS', chunk_rows)
+    monkeypatch.setattr(dataset, 'DEDUPE_BLOCK_ROWS', 128)
+    data = dataset.read_csv('data/results.csv', memory_budget_mb=0)
+    pd.testing.assert_frame_equal(data, _cleaned('data/results.csv'))
+
+
+def test_read_csv_of_header_only(results):
+    results.head(0).to_csv('data/empty.csv', index=False)
+    data = dataset.read_csv('data/empty.csv')
+    assert data.empty
+    assert list(data.columns) == list(_cleaned('data/empty.csv').columns)
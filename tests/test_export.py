@@ -0,0 +1,74 @@
+import io
+
+import flask
+import openpyxl
+import pandas as pd
+import pytest
+
+import dataset
+import export
+from store import ResultsStore
+
+
+@pytest.fixture
+def store(results):
+    return ResultsStore()
+
+
+@pytest.fixture
+def client(store):
+    server = flask.Flask(__name__)
+    export.init_app(server, store)
+    return server.test_client()
+
+
+def _selection(store, depth):
+    # the selection of that depth with the most students
+    keys = [key for key in store.index.bounds if len(key) == depth]
+    return max(keys, key=lambda key: len(store.roster(*key)))
+
+
+def _expected(store, key, decision=None):
+    rows = store.roster(*key).drop(columns='id')
+    if decision is not None:
+        rows = rows[rows['decision'] == decision]
+    return rows.reset_index(drop=True)
+
+
+@pytest.mark.parametrize('depth', [1, len(dataset.LEVELS)])
+def test_csv_export(store, client, monkeypatch, depth):
+    # several chunks, with the header only once
+    monkeypatch.setattr(export, 'EXPORT_CHUNK_ROWS', 2)
+    key = _selection(store, depth)
+    expected = _expected(store, key)
+    assert len(expected) > 2
+    response = client.get(export.export_url(key))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'].endswith('.csv"')
+    exported = pd.read_csv(io.BytesIO(response.get_data()), dtype=str, keep_default_na=False)
+    assert exported.columns.tolist() == [str(column) for column in expected.columns]
+    assert exported['regnum'].tolist() == expected['regnum'].astype(str).tolist()
+    assert exported['decision'].tolist() == expected['decision'].astype(str).tolist()
+
+
+def test_xlsx_export_of_one_decision(store, client):
+    key = _selection(store, len(dataset.LEVELS))
+    decision = store.roster(*key)['decision'].dropna().iloc[0]
+    expected = _expected(store, key, decision)
+    response = client.get(export.export_url(key, decision, 'xlsx'))
+    assert response.status_code == 200
+    sheet = openpyxl.load_workbook(io.BytesIO(response.get_data())).active
+    rows = list(sheet.values)
+    assert list(rows[0]) == [str(column) for column in expected.columns]
+    assert [row[0] for row in rows[1:]] == expected['regnum'].tolist()
+    assert {row[rows[0].index('decision')] for row in rows[1:]} == {decision}
+
+
+@pytest.mark.parametrize('url, status', [
+    ('/export/decisions.csv', 400),
+    ('/export/decisions.csv?faculty=Nowhere', 404),
+    ('/export/decisions.pdf?faculty=Nowhere', 404),
+])
+def test_export_rejects_unknown_selections(client, url, status):
+    assert client.get(url).status_code == status
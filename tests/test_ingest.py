@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import dataset
+from ingest import PROCESSED_DIR, BatchWatcher
+from partitions import PartitionedStore
+from sqlstore import SqliteStore
+from store import ResultsStore
+from test_stores import assert_same_results
+
+
+@pytest.mark.parametrize('store_class', [ResultsStore, SqliteStore, PartitionedStore])
+def test_batch_ingested_once_across_workers(results, batch, store_class):
+    # two workers watch the drop directory. the first to see the batch
+    # merges it and moves it aside, the other reloads what it wrote, and so
+    # does a worker started afterwards without merging the batch again
+    os.makedirs('data/incoming')
+    os.replace('data/batch.csv', 'data/incoming/batch.csv')
+    stores = [store_class(), store_class()]
+    versions = [store.version for store in stores]
+    watchers = [BatchWatcher(store, 'data/incoming') for store in stores]
+    # a file is only merged once it held still for a whole poll
+    for _ in range(2):
+        for watcher in watchers:
+            watcher.poll()
+    assert not os.path.exists('data/incoming/batch.csv')
+    assert len(os.listdir(os.path.join('data/incoming', PROCESSED_DIR))) == 1
+    assert [store.version for store in stores] == [version + 1 for version in versions]
+
+    regnums = batch['regnum'].dropna().unique()
+    assert_same_results(stores[1], stores[0], regnums)
+    restarted = store_class()
+    BatchWatcher(restarted, 'data/incoming').poll()
+    assert restarted.version == versions[0]
+    assert restarted.options.tree == stores[0].options.tree
+    assert restarted.cube.total(()) == stores[0].cube.total(())
+
+
+def test_ingest_maps_the_next_snapshot_generation(results, batch):
+    store = ResultsStore()
+    store.ingest(dataset.read_csv('data/batch.csv'))
+    store.ingest(dataset.read_csv('data/batch.csv'))
+    # the older generations are gone, the store serves from the newest
+    assert dataset.snapshot_generations(dataset.DATA_PATH) == [2]
+    frame_path, _ = dataset.snapshot_paths(dataset.DATA_PATH, generation=2)
+    assert store.data.equals(dataset.map_feather(frame_path))
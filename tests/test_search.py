@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+from search import StudentSearch, student_names, words
+
+NAMES = pd.DataFrame({
+    'regnum': ['R0000001A', 'R0000002B', 'R0000003C', 'R0000004D', 'R1000005E'],
+    'firstnames': ['Grace Anne', 'Tendai', 'grace', "Mary-Jane", np.nan],
+    'surname': ['Banda', 'Moyo', 'Bandawe', "O'Connor", 'Dube'],
+})
+
+
+def _matching(names, query):
+    # every student having a word starting with each word of the query
+    found = set()
+    if not words(query):
+        return found
+    for row in names.itertuples(index=False):
+        have = [word for value in row if isinstance(value, str) for word in words(value)]
+        if all(any(word.startswith(part) for word in have) for part in words(query)):
+            found.add(row.regnum)
+    return found
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('grace', {'R0000001A', 'R0000003C'}),
+    ('GRA', {'R0000001A', 'R0000003C'}),
+    ('band', {'R0000001A', 'R0000003C'}),
+    ('bandaw', {'R0000003C'}),
+    ('grace banda', {'R0000001A', 'R0000003C'}),
+    ('banda anne', {'R0000001A'}),
+    ('r000000', {'R0000001A', 'R0000002B', 'R0000003C', 'R0000004D'}),
+    ('r0000002b', {'R0000002B'}),
+    ('mary-j', {'R0000004D'}),
+    ("o'con", {'R0000004D'}),
+    ('dube', {'R1000005E'}),
+    ('grace moyo', set()),
+    ('zz', set()),
+    ('', set()),
+    ('  , ', set()),
+])
+def test_search_names_and_prefixes(query, expected):
+    search = StudentSearch(NAMES)
+    assert {regnum for regnum, _ in search.search(query, limit=100)} == expected
+    assert expected == _matching(NAMES, query)
+
+
+def test_search_labels_and_limit():
+    search = StudentSearch(NAMES)
+    assert search.search('R1') == [('R1000005E', 'R1000005E Dube')]
+    assert search.search('tendai') == [('R0000002B', 'R0000002B Tendai Moyo')]
+    assert len(search.search('r', limit=3)) == 3
+
+
+def test_search_matches_scanning_the_results(results):
+    names = student_names(dataset.read_csv())
+    search = StudentSearch(names)
+    queries = ['a', 'gr', 'ban', 'r00001', 'grace b', 'chi mo', 'x']
+    queries += names['surname'].astype(str).str[:3].unique().tolist()[:10]
+    for query in queries:
+        found = {regnum for regnum, _ in search.search(query, limit=len(names))}
+        assert found == _matching(names, query), query
+
+
+def test_updated_matches_rebuilding(results, batch):
+    data = dataset.read_csv()
+    search = StudentSearch(student_names(data)).updated(dataset.read_csv('data/batch.csv'))
+    merged, _, _ = dataset.merge_batch(data, dataset.read_csv('data/batch.csv'),
+                                       dataset.StudentIndex(data))
+    expected = StudentSearch(student_names(merged))
+    for query in ['a', 'gr', 'ban', 'n00000', 'r00001', 'grace b']:
+        assert sorted(search.search(query, limit=10**6)) == \
+            sorted(expected.search(query, limit=10**6)), query
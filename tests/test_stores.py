@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+from aggregates import CUBE
+import partitions
+from partitions import PartitionedStore
+from sqlstore import SqliteStore
+from store import ResultsStore
+
+
+def _keys(options, key=()):
+    # every filter selection of the dropdown cascade, faculty on down
+    for value in options.options(*key):
+        yield key + (value,)
+        if len(key) + 1 < len(dataset.LEVELS):
+            yield from _keys(options, key + (value,))
+
+
+def _reloaded(results, batch):
+    # the csv with the batch appended, as a restart after the batch was
+    # added to it would read it
+    pd.concat([results, batch]).to_csv('data/reloaded.csv', index=False)
+    return 'data/reloaded.csv'
+
+
+def assert_same_frames(left, right, check_dtype=True):
+    # an ingest appends the values it hasn't seen to the categories of the
+    # columns other than the levels, a reload sorts them. so the values are
+    # compared, and what comes out in their order (modules, grades) by label
+    pd.testing.assert_frame_equal(left, right, check_dtype=check_dtype,
+                                  check_categorical=False)
+
+
+def assert_same_results(store, expected, regnums, check_dtype=True):
+    assert store.options.tree == expected.options.tree
+    for key in _keys(expected.options):
+        assert store.cube.total(key) == expected.cube.total(key), key
+        # breakdowns split by decision are asked for one decision at a time
+        decisions = expected.cube.counts(key, 'decision').index.tolist()
+        for (by, split), depths in CUBE.items():
+            if by is None or len(key) not in depths:
+                continue
+            for decision in decisions if split else [None]:
+                pd.testing.assert_series_equal(
+                    store.cube.counts(key, by, decision).sort_index(),
+                    expected.cube.counts(key, by, decision).sort_index())
+        if len(key) == len(dataset.LEVELS):
+            # the index is row positions, of a partition in the partitioned store
+            assert_same_frames(store.roster(*key).reset_index(drop=True),
+                               expected.roster(*key).reset_index(drop=True), check_dtype)
+    for faculty in expected.options.options():
+        assert_same_frames(store.modules.pass_rates(faculty).sort_index(axis=1),
+                           expected.modules.pass_rates(faculty).sort_index(axis=1), check_dtype)
+        for programme in expected.options.options(faculty):
+            assert_same_frames(store.modules.programme(faculty, programme).sort_index(),
+                               expected.modules.programme(faculty, programme).sort_index(),
+                               check_dtype)
+    for regnum in regnums:
+        assert_same_frames(store.students.rows(regnum).reset_index(drop=True),
+                           expected.students.rows(regnum).reset_index(drop=True), check_dtype)
+        assert store.search.search(regnum) == expected.search.search(regnum)
+
+
+def test_merge_batch_matches_reading_everything(results, batch):
+    data = dataset.read_csv()
+    merged, faculties, students = dataset.merge_batch(
+        data, dataset.read_csv('data/batch.csv'), dataset.StudentIndex(data))
+    expected = dataset.read_csv(_reloaded(results, batch))
+    assert_same_frames(merged, expected)
+    assert set(faculties) == set(batch['faculty'])
+    # the student index moved along with the rows is the one of the merged frame
+    rebuilt = dataset.StudentIndex(merged)
+    np.testing.assert_array_equal(students.positions, rebuilt.positions)
+    np.testing.assert_array_equal(students.offsets, rebuilt.offsets)
+
+
+@pytest.mark.parametrize('store_class', [ResultsStore, SqliteStore, PartitionedStore])
+def test_ingest_matches_reload(results, batch, store_class):
+    store = store_class()
+    version = store.version
+    store.ingest(dataset.read_csv('data/batch.csv'))
+    assert store.version == version + 1
+    expected = store_class(_reloaded(results, batch))
+    assert_same_results(store, expected, batch['regnum'].dropna().unique())
+
+
+@pytest.mark.parametrize('store_class', [SqliteStore, PartitionedStore])
+def test_store_matches_frame(results, store_class):
+    # a few results without a regnum, which are nobody's
+    results.loc[results.index[::97], 'regnum'] = np.nan
+    results.to_csv('data/new_data.csv', index=False)
+    regnums = results['regnum'].dropna().drop_duplicates().sample(20, random_state=0)
+    # sqlite hands back plain object columns
+    assert_same_results(store_class(), ResultsStore(), regnums, check_dtype=False)
+
+
+def test_partitioned_store_behind_an_ingest(results, batch, monkeypatch):
+    # another worker on the same partitions keeps reading the files of its
+    # catalog while one ingests, and reloads once they are deleted
+    store, other = PartitionedStore(), PartitionedStore()
+    before = {part: len(other.partition(part).data) for part in other.catalog.files}
+    other.partitions.clear()
+    store.ingest(dataset.read_csv('data/batch.csv'))
+    for part, rows in before.items():
+        data = other.partition(part).data
+        assert len(data) == rows
+        assert data[dataset.LEVELS].notna().all().all()
+
+    monkeypatch.setattr(partitions, 'PARTITION_RETIRE_SECONDS', 0)
+    store.ingest(dataset.read_csv('data/batch.csv'))
+    other.partitions.clear()
+    expected = {part: len(store.partition(part).data)
+                                   for part in store.catalog.files}
+    assert {part: len(other.partition(part).data) for part in store.catalog.files} == expected
+    assert other.catalog.generation == store.catalog.generation
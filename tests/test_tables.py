@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tables import filter_frame, page_count, page_frame, sort_frame
+
+
+@pytest.fixture
+def students():
+    # the columns of a decision list, with the categories in an order that
+    # isn't the order of their values, as the frame's are after an ingest
+    return pd.DataFrame({
+        'regnum': pd.Categorical(['R3', 'R1', 'R2', 'R4'],
+                                 categories=['R4', 'R3', 'R2', 'R1']),
+        'surname': pd.Categorical(['Moyo', 'banda', 'Dube', "O'Neil"],
+                                  categories=["O'Neil", 'Moyo', 'Dube', 'banda']),
+        'academicyear': pd.Categorical([2021, 2019, 2020, 2021],
+                                       categories=[2021, 2020, 2019]),
+        'mark': np.array([55, 70, 40, 70], dtype='int16'),
+    })
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', ['R3', 'R1', 'R2', 'R4']),
+    ('{mark} ge 55', ['R3', 'R1', 'R4']),
+    ('{mark} lt 55', ['R2']),
+    ('{mark} eq 70 && {academicyear} eq 2021', ['R4']),
+    ('{academicyear} gt 2019', ['R3', 'R2', 'R4']),
+    ('{surname} contains ban', ['R1']),
+    ('{surname} contains "o\'n"', ['R4']),
+    ('{surname} eq Moyo', ['R3']),
+    ('{surname} ne Moyo', ['R1', 'R2', 'R4']),
+    ('{regnum} datestartswith R', ['R3', 'R1', 'R2', 'R4']),
+    # a text filter on a numeric column
+    ('{mark} eq abc', []),
+    # columns that aren't in the frame are ignored
+    ('{decision} eq PASS', ['R3', 'R1', 'R2', 'R4']),
+])
+def test_filter_frame(students, query, expected):
+    assert filter_frame(students, query)['regnum'].tolist() == expected
+
+
+@pytest.mark.parametrize('sort_by, expected', [
+    ([], ['R3', 'R1', 'R2', 'R4']),
+    # on the values, not the order of the categories
+    ([{'column_id': 'regnum', 'direction': 'asc'}], ['R1', 'R2', 'R3', 'R4']),
+    ([{'column_id': 'academicyear', 'direction': 'asc'}], ['R1', 'R2', 'R3', 'R4']),
+    ([{'column_id': 'surname', 'direction': 'desc'}], ['R1', 'R4', 'R3', 'R2']),
+    # stable, ties keep their order
+    ([{'column_id': 'mark', 'direction': 'desc'}], ['R1', 'R4', 'R3', 'R2']),
+    ([{'column_id': 'mark', 'direction': 'desc'},
+      {'column_id': 'regnum', 'direction': 'desc'}], ['R4', 'R1', 'R3', 'R2']),
+    ([{'column_id': 'decision', 'direction': 'asc'}], ['R3', 'R1', 'R2', 'R4']),
+])
+def test_sort_frame(students, sort_by, expected):
+    assert sort_frame(students, sort_by)['regnum'].tolist() == expected
+
+
+def test_page_frame(students):
+    assert page_frame(students, None, 3)['regnum'].tolist() == ['R3', 'R1', 'R2']
+    assert page_frame(students, 1, 3)['regnum'].tolist() == ['R4']
+    assert page_count(students, 3) == 2
+    assert page_count(students.iloc[0:0], 3) == 1
@@ -0,0 +1,89 @@
+import logging
+import sys
+import threading
+import time
+
+# seconds between progress messages
+WARMUP_LOG_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer:
+    # runs tasks that fill memoized caches (figure functions called with
+    # every filter selection, say) in a background thread of this process.
+    # tasks() lists the (func, args) calls, most general views first. every
+    # task is run, and each cache grows by the entries the warm-up added to
+    # it, so its own maxsize is left for the views built on demand and those
+    # never evict the warmed ones. start() warms again from the top after
+    # the results changed and the caches were cleared, abandoning a warm-up
+    # of the old results
+
+    def __init__(self, caches, tasks):
+        self.caches = caches
+        self.tasks = tasks
+        self.sizes = [cache.maxsize for cache in caches]
+        self.done = threading.Event()
+        self.warmed = 0
+        self.entries = 0
+        self.failed = 0
+        self.seconds = None
+        self._pending = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _warm(self):
+        start = last = time.perf_counter()
+        self.warmed = self.failed = 0
+        lengths = [len(cache) for cache in self.caches]
+        for cache in self.caches:
+            cache.maxsize = sys.maxsize
+        tasks = self.tasks()
+        for func, args in tasks:
+            if self._pending.is_set():
+                break
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("warming %s%r failed", func.__name__, args)
+                self.failed += 1
+            self.warmed += 1
+            now = time.perf_counter()
+            if now - last >= WARMUP_LOG_SECONDS:
+                last = now
+                logger.info("warming caches: %d/%d tasks after %.1fs",
+                            self.warmed, len(tasks), now - start)
+        added = [max(len(cache) - length, 0) for cache, length in zip(self.caches, lengths)]
+        for cache, size, entries in zip(self.caches, self.sizes, added):
+            cache.maxsize = size + entries
+        self.entries = sum(added)
+        self.seconds = time.perf_counter() - start
+        logger.info("warmed %d cache entries from %d/%d tasks in %.1fs (%d failed)",
+                    self.entries, self.warmed, len(tasks), self.seconds, self.failed)
+
+    def run(self):
+        # warm in this thread, over again while start() was called meanwhile
+        self.done.clear()
+        while True:
+            self._pending.clear()
+            try:
+                self._warm()
+            except Exception:
+                logger.exception("cache warm-up failed")
+            with self._lock:
+                if not self._pending.is_set():
+                    self._thread = None
+                    self.done.set()
+                    return
+
+    def start(self):
+        with self._lock:
+            self._pending.set()
+            self.done.clear()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='cache-warmup',
+                                                daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)